@@ -0,0 +1,241 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+import datetime as dt
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from config.config import read_research_config
+from modules.research.cache import get_page_cache, get_response_cache
+from modules.research.llm import summarize_calls
+from modules.research.research import DeepResearch
+
+# Headless entry point: runs research on many topics without any GUI imports.
+#
+#   python cli.py topics.txt --workers 2
+#   cat topics.txt | python cli.py
+#   python cli.py --resume "output/sessions/<session>.jsonl"
+#
+# Topics are read one per line; blank lines and lines starting with "#" are
+# skipped. Every worker thread runs its own DeepResearch on its own event loop,
+# while the page, search and LLM response caches are shared by the process.
+
+
+def read_topics(path: str = None) -> list:
+    """Reads topics from `path`, or from stdin when it is None or "-"."""
+    if path in (None, "-"):
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    return [line.strip() for line in lines if line.strip() and not line.startswith("#")]
+
+
+def sanitize(topic: str) -> str:
+    return "".join(c for c in topic if c.isalnum() or c in (" ", "_")).strip()[:60]
+
+
+class BatchRunner:
+    """Runs DeepResearch for a list of topics on a pool of worker threads."""
+
+    def __init__(
+        self,
+        output_dir: str,
+        workers: int = 2,
+        research_iterations: int = 3,
+        web_iterations: int = 5,
+        tree: bool = False,
+        resume: bool = False,
+    ):
+        self.output_dir = output_dir
+        self.workers = max(1, workers)
+        self.research_iterations = research_iterations
+        self.web_iterations = web_iterations
+        self.tree = tree
+        # With resume, the items run are session checkpoints instead of topics.
+        self.resume = resume
+        self.results = []
+        self._active = set()
+        self._lock = threading.Lock()
+
+    def run(self, topics: list) -> list:
+        os.makedirs(self.output_dir, exist_ok=True)
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        futures = [
+            executor.submit(self.run_topic, n, topic)
+            for n, topic in enumerate(topics, start=1)
+        ]
+        try:
+            for future in as_completed(futures):
+                self.results.append(future.result())
+        except KeyboardInterrupt:
+            logging.warning("Interrupted, cancelling the running research...")
+            self.cancel()
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+        executor.shutdown()
+        return self.results
+
+    def cancel(self):
+        with self._lock:
+            for research in self._active:
+                research.cancel()
+
+    def run_topic(self, n: int, topic: str) -> dict:
+        """Researches one topic and writes its report and JSON log; never raises."""
+        steps = []
+
+        def on_status(message):
+            steps.append(message[0])
+            logging.info(f"[{n}] {message[0].strip()}")
+
+        start = time.time()
+        research = DeepResearch(status_callback=on_status, stream_tokens=False)
+        with self._lock:
+            self._active.add(research)
+        error = None
+        try:
+            if self.resume:
+                research.resume(topic)
+                topic = research.origin_topic
+            elif self.tree:
+                research.start_research_tree(topic, web_iterations=self.web_iterations)
+            else:
+                research.start_research(
+                    topic,
+                    research_iterations=self.research_iterations,
+                    web_iterations=self.web_iterations,
+                )
+        except Exception as e:
+            logging.exception(f"[{n}] Research on '{topic}' failed")
+            error = str(e)
+        finally:
+            with self._lock:
+                self._active.discard(research)
+
+        if error is None and research.report.startswith("Error:"):
+            # The LLM layer reports a failed generation as its reply.
+            logging.error(f"[{n}] Report on '{topic}' failed: {research.report}")
+            error = research.report
+        base = os.path.join(self.output_dir, f"{n:03d} {sanitize(topic)}")
+        report_path = None
+        if research.report and error is None:
+            report_path = base + ".md"
+            with open(report_path, "w", encoding="utf-8") as f:
+                f.write(research.report)
+        result = {
+            "n": n,
+            "topic": topic,
+            "checkpoint": research.checkpoint_path,
+            "status": "error" if error else "ok" if research.report else "cancelled",
+            "error": error,
+            "elapsed_seconds": round(time.time() - start, 2),
+            "report": report_path,
+            "steps": steps,
+            "summary": research.run_summary,
+        }
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        logging.info(
+            f"[{n}] {result['status']} in {result['elapsed_seconds']:.1f}s: {topic}"
+        )
+        return result
+
+
+def throughput(results: list, elapsed: float) -> dict:
+    """Aggregates the per-topic results of a batch into throughput statistics."""
+    calls = [c for r in results for c in (r["summary"] or {}).get("calls", [])]
+    done = [r for r in results if r["status"] == "ok"]
+    page_cache = get_page_cache()
+    response_cache = get_response_cache()
+    return {
+        "topics": len(results),
+        "succeeded": len(done),
+        "failed": len(results) - len(done),
+        "elapsed_seconds": round(elapsed, 2),
+        "topics_per_hour": round(len(done) / elapsed * 3600, 2) if elapsed else None,
+        "mean_topic_seconds": (
+            round(sum(r["elapsed_seconds"] for r in done) / len(done), 2)
+            if done
+            else None
+        ),
+        "llm": summarize_calls(calls),
+        "page_cache": page_cache.stats() if page_cache else {},
+        "llm_cache": response_cache.stats() if response_cache else {},
+    }
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Run deep research on many topics without the GUI."
+    )
+    parser.add_argument(
+        "topics", nargs="?", help="file with one topic per line (default: stdin)"
+    )
+    parser.add_argument("-w", "--workers", type=int, help="topics researched at once")
+    parser.add_argument("-i", "--iterations", type=int, default=3)
+    parser.add_argument(
+        "--web", type=int, default=5, help="search results fetched per iteration"
+    )
+    parser.add_argument("--tree", action="store_true", help="research as a tree")
+    parser.add_argument(
+        "--resume",
+        nargs="+",
+        metavar="SESSION",
+        help="continue the research checkpointed in these session .jsonl files",
+    )
+    parser.add_argument("-o", "--output", help="output directory")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format="%(asctime)s %(levelname)s %(message)s",
+    )
+    research_config = read_research_config()
+    batch_config = research_config.get("batch", {})
+    topics = args.resume or read_topics(args.topics)
+    if not topics:
+        print("No topics given.", file=sys.stderr)
+        return 2
+    output_dir = args.output or os.path.join(
+        research_config["research_output"],
+        "batch",
+        f"{dt.datetime.now():%Y%m%d-%H%M%S}",
+    )
+    runner = BatchRunner(
+        output_dir,
+        workers=args.workers or batch_config.get("workers", 2),
+        research_iterations=args.iterations,
+        web_iterations=args.web,
+        tree=args.tree,
+        resume=bool(args.resume),
+    )
+    print(f"Researching {len(topics)} topics with {runner.workers} workers...")
+    start = time.time()
+    try:
+        results = runner.run(topics)
+    except KeyboardInterrupt:
+        return 130
+    stats = throughput(results, time.time() - start)
+    with open(os.path.join(output_dir, "batch.json"), "w", encoding="utf-8") as f:
+        json.dump(stats, f, indent=2, ensure_ascii=False)
+
+    for r in sorted(results, key=lambda r: r["n"]):
+        print(f"{r['status']:>9}  {r['elapsed_seconds']:8.1f}s  {r['topic']}")
+    llm = stats["llm"]
+    print(
+        f"\n{stats['succeeded']}/{stats['topics']} topics in {stats['elapsed_seconds']:.1f}s "
+        f"({stats['topics_per_hour']} topics/hour, mean {stats['mean_topic_seconds']}s per topic)"
+    )
+    print(
+        f"LLM: {llm['calls']} calls, {llm['prompt_tokens']} prompt + {llm['completion_tokens']} completion tokens, {llm['tokens_per_second'] or 0} tokens/s"
+    )
+    print(f"Output: {output_dir}")
+    return 0 if stats["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,6 @@
 import os
 import json
+from functools import lru_cache
 
 
 FILE_DIR = os.path.dirname(__file__)
@@ -8,7 +9,9 @@ TOOLS_CONFIG_PATH = os.path.join(FILE_DIR, "tools_config.json")
 SETTINGS_PATH = os.path.join(FILE_DIR, "settings.json")
 
 
-def read_tools_config() -> dict:
+@lru_cache(maxsize=1)
+def read_tools_config() -> list:
+    """Reads tools_config.json once; every Agent shares the parsed list."""
     with open(TOOLS_CONFIG_PATH, "r") as f:
         return json.load(f)
 
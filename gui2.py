@@ -1,7 +1,11 @@
+import time
+
+STARTED = time.perf_counter()
+
 import customtkinter
 from modules.gui.app import App
 
 
 if __name__ == "__main__":
-    app = App()
+    app = App(started=STARTED)
     app.mainloop()
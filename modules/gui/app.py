@@ -1,14 +1,24 @@
 import os
+import time
+import queue
+import logging
+import importlib
+import threading
 import customtkinter as ctk
 from modules.gui.pages.start_page import StartPage
-from modules.gui.pages.settings import SettingsPage
-from modules.gui.pages.research_page import ResearchPage
 
 from config.config import read_settings
 from modules.utils.utils import get_ollama_models
 
 ICON_PATH = os.path.join("assets", "rabbit.ico")
 
+# Pages other than the StartPage are imported and built the first time they are
+# shown; the ResearchPage pulls in the whole research engine.
+PAGES = {
+    "SettingsPage": ("modules.gui.pages.settings", "SettingsPage"),
+    "ResearchPage": ("modules.gui.pages.research_page", "ResearchPage"),
+}
+
 
 class App(ctk.CTk):
     """
@@ -16,8 +26,11 @@ class App(ctk.CTk):
     This class controls the window and page switching.
     """
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, started: float = None, **kwargs):
         super().__init__(*args, **kwargs)
+        # perf_counter() at launch, so the time to the first window can be reported.
+        self.started = started or time.perf_counter()
+        self.startup_seconds = None
 
         # --- Configure the main window ---
         self.iconbitmap(ICON_PATH)
@@ -35,31 +48,73 @@ class App(ctk.CTk):
 
         self.recursion_depth = self.settings["recursion_depth"]
         self.research_config = self.settings
-        self.available_models = get_ollama_models()
+        # Filled in by a background thread; the settings page shows a placeholder until then.
+        self.available_models = []
+        self.models_queue = queue.Queue()
+        threading.Thread(target=self._load_models, daemon=True).start()
+        self._process_models_queue()
 
         # --- The container frame ---
         # This frame holds all the pages (other frames).
-        container = ctk.CTkFrame(self, fg_color="transparent")
-        container.pack(side="top", fill="both", expand=True)
-        container.grid_rowconfigure(0, weight=1)
-        container.grid_columnconfigure(0, weight=1)
+        self.container = ctk.CTkFrame(self, fg_color="transparent")
+        self.container.pack(side="top", fill="both", expand=True)
+        self.container.grid_rowconfigure(0, weight=1)
+        self.container.grid_columnconfigure(0, weight=1)
 
         self.frames = {}
-        # Loop through a tuple of page classes to initialize them
-        for F in (StartPage, SettingsPage, ResearchPage):
-            page_name = F.__name__
-            # Create an instance of the page
-            frame = F(parent=container, controller=self)
-            self.frames[page_name] = frame
-            # Place the frame in the grid. It will be stacked with other frames.
-            frame.grid(row=0, column=0, sticky="nsew")
+        start_page = StartPage(parent=self.container, controller=self)
+        start_page.grid(row=0, column=0, sticky="nsew")
+        self.frames["StartPage"] = start_page
 
         # Show the initial page
         self.show_frame("StartPage")
+        self.bind("<Map>", self._on_first_map, add="+")
+        # Warm up the configured models so the first research step starts hot.
+        start_page.start_preload(self.settings)
+
+    def get_frame(self, page_name):
+        """Returns the page `page_name`, building it the first time it is needed."""
+        if page_name not in self.frames:
+            module_name, class_name = PAGES[page_name]
+            page_class = getattr(importlib.import_module(module_name), class_name)
+            frame = page_class(parent=self.container, controller=self)
+            # Place the frame in the grid. It will be stacked with other frames.
+            frame.grid(row=0, column=0, sticky="nsew")
+            self.frames[page_name] = frame
+        return self.frames[page_name]
 
     def show_frame(self, page_name):
         """
         Raises the specified frame to the top of the stacking order, making it visible.
         """
-        frame = self.frames[page_name]
+        frame = self.get_frame(page_name)
         frame.tkraise()
+
+    def _on_first_map(self, event):
+        """Reports how long it took from launch until the window was first shown."""
+        if event.widget is not self or self.startup_seconds is not None:
+            return
+        self.startup_seconds = time.perf_counter() - self.started
+        logging.info(f"Time to first window: {self.startup_seconds:.2f}s")
+        print(f"Time to first window: {self.startup_seconds:.2f}s")
+
+    def _load_models(self):
+        """Lists the Ollama models on a background thread; always answers, with [] on failure."""
+        models = []
+        try:
+            models = get_ollama_models() or []
+        except Exception as e:
+            # e.g. FileNotFoundError when the ollama binary is not installed.
+            logging.warning(f"Could not list Ollama models: {e}")
+        finally:
+            self.models_queue.put(models)
+
+    def _process_models_queue(self):
+        """Picks up the model list once the background thread has it. Runs on the main thread."""
+        try:
+            self.available_models = self.models_queue.get_nowait()
+        except queue.Empty:
+            self.after(200, self._process_models_queue)
+            return
+        if "SettingsPage" in self.frames:
+            self.frames["SettingsPage"].set_available_models(self.available_models)
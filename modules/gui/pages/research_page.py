@@ -2,7 +2,7 @@ import os
 import threading
 from tkinter import filedialog
 import customtkinter as ctk
-from PIL import Image, ImageSequence
+from PIL import Image
 import queue
 import random
 from modules.research.research import DeepResearch
@@ -36,14 +36,12 @@ class ResearchPage(ctk.CTkFrame):
         self.controller = controller
         # --- Setup Queue for thread-safe GUI updates ---
         self.update_queue = queue.Queue()
-        # Instantiate the research class, passing it our update method as a callback
-        self.deep_research = DeepResearch(status_callback=self.queue_status_update)
+        self._streaming = False
+        # The research engine and the chat model are built on first use.
+        self.deep_research = None
         self.chat_model_name = settings["model"]["chat"]["model_name"]
         self.chat_context_window = settings["model"]["chat"]["context_window"]
-        self.chat_agent = LLM(
-            self.chat_model_name,
-            system_prompt="You are a chat agent. Help the user with questions no matter the topic.",
-        )
+        self._chat_agent = None
 
         # Configure a 2-column grid. Column 0 for text, Column 1 for GIF.
         self.grid_columnconfigure(0, weight=1)  # Status box gets more space
@@ -108,34 +106,54 @@ class ResearchPage(ctk.CTkFrame):
         # self.download_button.grid_remove()
         # --- GIF Animation Attributes ---
         self.gif_frames = []
+        self.gif_image = None
+        self.gif_frame_count = 0
         self.animation_job = None
-        self._load_gif()
         self._process_queue()
 
+    @property
+    def chat_agent(self) -> LLM:
+        if self._chat_agent is None:
+            self._chat_agent = LLM(
+                self.chat_model_name,
+                system_prompt="You are a chat agent. Help the user with questions no matter the topic.",
+            )
+        return self._chat_agent
+
     def _load_gif(self):
-        """Loads GIF frames into a list."""
+        """Opens the GIF; its frames are decoded one by one as the animation reaches them."""
         choice = GIFS[0]
         # random.choice(GIFS)
         print(f"CHOICE: {choice}")
         try:
             # Assumes a 'loading.gif' file in the same directory
-            gif_image = Image.open(choice["path"])
-            for frame in ImageSequence.Iterator(gif_image):
-                ctk_frame = ctk.CTkImage(
-                    light_image=frame.copy().resize(choice["dim"]),
-                    size=dimensions["gif"],
-                )
-                self.gif_frames.append(ctk_frame)
+            self.gif_image = Image.open(choice["path"])
+            self.gif_frame_count = getattr(self.gif_image, "n_frames", 1)
         except FileNotFoundError:
             self.gif_label.configure(text="GIF not found")
             print("loading.gif not found. Please add it to the script's directory.")
 
+    def _gif_frame(self, frame_index):
+        """Returns frame `frame_index`, decoding the frames up to it on first use."""
+        # GIF frames build on each other, so they are decoded in order.
+        while len(self.gif_frames) <= frame_index:
+            self.gif_image.seek(len(self.gif_frames))
+            self.gif_frames.append(
+                ctk.CTkImage(
+                    light_image=self.gif_image.copy().resize(GIFS[0]["dim"]),
+                    size=dimensions["gif"],
+                )
+            )
+        return self.gif_frames[frame_index]
+
     def _animate_gif(self, frame_index):
         """Updates the GIF label with the next frame."""
-        if self.gif_frames:
-            frame = self.gif_frames[frame_index]
+        if self.gif_image is None:
+            self._load_gif()
+        if self.gif_frame_count:
+            frame = self._gif_frame(frame_index)
             self.gif_label.configure(image=frame)
-            next_frame_index = (frame_index + 1) % len(self.gif_frames)
+            next_frame_index = (frame_index + 1) % self.gif_frame_count
             self.animation_job = self.after(
                 100, self._animate_gif, next_frame_index
             )  # 100ms delay
@@ -150,6 +168,8 @@ class ResearchPage(ctk.CTkFrame):
     def _save_report(self):
         """Opens a file dialog to save the final report."""
         print(f"REPORT CLICKED")
+        if self.deep_research is None:
+            return
         print(f"DEEP: {self.deep_research.get_report()}")
         if self.deep_research.report == "":
             pass
@@ -174,9 +194,16 @@ class ResearchPage(ctk.CTkFrame):
                 with open(filepath, "w", encoding="utf-8") as f:
                     f.write(report_text)
                 print(f"Report saved to {filepath}")
+                if self.deep_research.run_summary:
+                    stats_path = self.deep_research.save_run_summary(
+                        os.path.splitext(filepath)[0] + ".stats.json"
+                    )
+                    print(f"Run summary saved to {stats_path}")
 
     def _stop_and_go_back(self):
-        """Stops animation and returns to the start page."""
+        """Cancels the running research, stops animation and returns to the start page."""
+        if self.deep_research is not None:
+            self.deep_research.cancel()
         self._stop_animation()
         self.controller.show_frame("StartPage")
 
@@ -187,21 +214,37 @@ class ResearchPage(ctk.CTkFrame):
     def _process_queue(self):
         """Checks the queue for messages and updates the GUI. Runs on the main thread."""
         try:
+            # Drain everything queued since the last tick and apply it as one widget
+            # update, so streamed tokens don't cost a redraw each.
+            text = ""
+            progress_value = None
             while not self.update_queue.empty():
-                message, current_step, max_steps = self.update_queue.get_nowait()
+                message_tuple = self.update_queue.get_nowait()
+                message, current_step, max_steps = message_tuple[:3]
+                is_token = len(message_tuple) > 3 and message_tuple[3] == "token"
+                if is_token:
+                    text += message
+                    self._streaming = True
+                else:
+                    if self._streaming:
+                        text += "\n"
+                        self._streaming = False
+                    text += f"{message}\n"
+                if max_steps > 0:
+                    progress_value = float(current_step) / float(max_steps)
+            if text:
                 self.status_box.configure(state="normal")
-                self.status_box.insert("end", f"{message}\n")
+                self.status_box.insert("end", text)
                 self.status_box.see("end")  # Auto-scroll to the bottom
                 self.status_box.configure(state="disabled")
-                if max_steps > 0:
-                    progress_value = float(current_step) / float(max_steps)
-                    self.progress_bar.set(progress_value)
-                    # When research is complete
-                    if progress_value >= 1.0:
-                        self._stop_animation()
-                        # self.gif_label.grid_remove()  # Hide GIF
-                        # self.back_button.grid_remove()  # Hide "New Research" button
-                        # self.download_button.grid()  # Show "Download" button
+            if progress_value is not None:
+                self.progress_bar.set(progress_value)
+                # When research is complete
+                if progress_value >= 1.0:
+                    self._stop_animation()
+                    # self.gif_label.grid_remove()  # Hide GIF
+                    # self.back_button.grid_remove()  # Hide "New Research" button
+                    # self.download_button.grid()  # Show "Download" button
 
         finally:
             # Schedule itself to run again
@@ -264,10 +307,27 @@ class ResearchPage(ctk.CTkFrame):
         self._stop_animation()
         self._animate_gif(0)
 
+        # Cancel any run still going and start over with a fresh engine, so two
+        # runs never share state or the queue.
+        if self.deep_research is not None:
+            self.deep_research.cancel()
+        self.deep_research = DeepResearch(status_callback=self.queue_status_update)
+        while not self.update_queue.empty():
+            self.update_queue.get_nowait()
+        self._streaming = False
+        self.progress_bar.set(0)
+
         # --- Create and start the research thread ---
-        thread = threading.Thread(
-            target=self.deep_research.start_research,
-            args=(query, int(settings["recursion_depth"])),
-            daemon=True,
-        )
+        if self.deep_research.research_config.get("tree", {}).get("enabled", False):
+            thread = threading.Thread(
+                target=self.deep_research.start_research_tree,
+                args=(query,),
+                daemon=True,
+            )
+        else:
+            thread = threading.Thread(
+                target=self.deep_research.start_research,
+                args=(query, int(settings["recursion_depth"])),
+                daemon=True,
+            )
         thread.start()
@@ -1,5 +1,5 @@
 import customtkinter as ctk
-from config.config import write_settings
+from config.config import read_settings, write_settings
 
 
 class SettingsPage(ctk.CTkFrame):
@@ -13,6 +13,7 @@ class SettingsPage(ctk.CTkFrame):
 
         self.context_vars = {}
         self.model_vars = {}  # To hold variables for the dropdowns
+        self.model_menus = {}
 
         title_label = ctk.CTkLabel(
             self, text="Settings", font=ctk.CTkFont(size=22, weight="bold")
@@ -70,10 +71,15 @@ class SettingsPage(ctk.CTkFrame):
             ]
             model_var = ctk.StringVar(value=initial_model)
             self.model_vars[agent] = model_var
+            # Until the model list arrives, the current model is the only choice.
             model_menu = ctk.CTkOptionMenu(
-                self, variable=model_var, values=self.controller.available_models
+                self,
+                variable=model_var,
+                values=self.controller.available_models or [initial_model],
+                state="normal" if self.controller.available_models else "disabled",
             )
             model_menu.grid(row=idx, column=2, padx=10, pady=8)
+            self.model_menus[agent] = model_menu
 
         # --- Save button ---
         save_btn = ctk.CTkButton(
@@ -90,13 +96,25 @@ class SettingsPage(ctk.CTkFrame):
         self.grid_columnconfigure(1, weight=1)
         self.grid_columnconfigure(2, weight=1)
 
+    def set_available_models(self, models: list):
+        """Fills the model dropdowns once the list of installed models is known."""
+        for agent, menu in self.model_menus.items():
+            menu.configure(
+                values=models or [self.model_vars[agent].get()], state="normal"
+            )
+
     def save_settings(self):
         """Saves the current settings and returns to the StartPage."""
         try:
             self.controller.recursion_depth = int(self.recursion_depth_var.get())
         except ValueError:
             print("Invalid input for recursion depth. Must be an integer.")
-        new_settings = {"recursion_depth": self.recursion_depth_var.get(), "model": {}}
+        # Sections this page does not edit, like the Ollama endpoints, are kept.
+        new_settings = {
+            **read_settings(),
+            "recursion_depth": self.recursion_depth_var.get(),
+            "model": {},
+        }
         for agent, var in self.context_vars.items():
             try:
                 self.controller.research_config["model"][agent]["context_window"] = int(
@@ -1,4 +1,6 @@
 import os
+import queue
+import threading
 import customtkinter as ctk
 from PIL import Image
 
@@ -17,6 +19,7 @@ class StartPage(ctk.CTkFrame):
         super().__init__(parent, fg_color="black")
         self.controller = controller
         self.configure(fg_color="black")
+        self.preload_queue = queue.Queue()
 
         # --- Widgets for the StartPage (recreating the new layout) ---
 
@@ -82,6 +85,31 @@ class StartPage(ctk.CTkFrame):
         )
         settings_button.place(relx=0.98, rely=0.98, anchor="se")
 
+    def start_preload(self, settings: dict):
+        """Loads the models in `settings` into Ollama on a background thread, showing progress."""
+        thread = threading.Thread(target=self._preload, args=(settings,), daemon=True)
+        thread.start()
+        self._process_preload_queue()
+
+    def _preload(self, settings: dict):
+        # Imported here so the research stack loads off the main thread, after the
+        # window is already up.
+        from modules.research.scheduler import preload_models, warm_up_models
+
+        preload_models(warm_up_models(settings), self.preload_queue.put)
+
+    def _process_preload_queue(self):
+        """Shows preload progress in the loading label. Runs on the main thread."""
+        finished = False
+        while not self.preload_queue.empty():
+            text, done, total = self.preload_queue.get_nowait()
+            self.loading_label.configure(text=f"{text} ({done}/{total})")
+            finished = done == total
+        if finished:
+            self.after(3000, lambda: self.loading_label.configure(text=""))
+        else:
+            self.after(200, self._process_preload_queue)
+
     def start_research(self):
         """Placeholder function for starting research."""
         query = self.search_var.get()
@@ -90,7 +118,7 @@ class StartPage(ctk.CTkFrame):
             return
 
         # Get the research page frame from the controller
-        research_page = self.controller.frames["ResearchPage"]
+        research_page = self.controller.get_frame("ResearchPage")
 
         # Call a method on the research page to initialize it with the new query
         research_page.start_new_research(query)
@@ -1,26 +1,97 @@
-def analyze(topic: str, context: list, agent, context_window: int):
-    prompt = f"Use these web search results to answer this question: {topic}. Here are the results: {context}"
-    response = agent.model.get_response(prompt, context_window=context_window)
-    return response
+import re
+from modules.research.context import pack_prompt
+
+# Every action has a blocking and an `_async` variant sharing one prompt builder.
+
+
+def _analyze_prompt(topic: str, context: list, agent, context_window: int, max_tokens):
+    prompt = "Use these web search results to answer this question: {topic}. Here are the results: {sources}"
+    packed = pack_prompt(
+        agent,
+        prompt.format(topic=topic, sources=""),
+        context,
+        context_window,
+        max_tokens,
+    )
+    return prompt.format(topic=topic, sources=packed["text"]), packed
+
 
+def analyze(
+    topic: str, context: list, agent, context_window: int, max_tokens: int = 2048
+):
+    """
+    Answers `topic` from the fetched sources, packed to fit the agent's context window.
 
-def critisize(analysis: str, context: list, agent, context_window: int) -> str:
-    prompt = f"""Critically evaluate the following analysis. Identify any potential biases,
+    `context` is a list of {"url", "text"} sources. Returns the response and the
+    packing report from pack_prompt, which says what was included and dropped.
+    """
+    prompt, packed = _analyze_prompt(topic, context, agent, context_window, max_tokens)
+    response = agent.model.get_response(
+        prompt, context_window=context_window, max_tokens=max_tokens, task="analyze"
+    )
+    return response, packed
+
+
+async def analyze_async(
+    topic: str, context: list, agent, context_window: int, max_tokens: int = 2048
+):
+    prompt, packed = _analyze_prompt(topic, context, agent, context_window, max_tokens)
+    response = await agent.model.aget_response(
+        prompt, context_window=context_window, max_tokens=max_tokens, task="analyze"
+    )
+    return response, packed
+
+
+def _critisize_prompt(
+    analysis: str, context: list, agent, context_window: int, max_tokens: int
+):
+    prompt = """Critically evaluate the following analysis. Identify any potential biases,
                     unstated assumptions, or logical fallacies. Is the evidence strong enough
-                    to support the conclusions? Return your findings in a paragraph. 
+                    to support the conclusions? Return your findings in a paragraph.
 
                     --- ANALYSIS ---
                     {analysis}
 
-                    --- SOURCES --- 
-                    {context}
+                    --- SOURCES ---
+                    {sources}
                     """
-    response = agent.model.get_response(prompt, context_window=context_window)
-    return response
+    packed = pack_prompt(
+        agent,
+        prompt.format(analysis=analysis, sources=""),
+        context,
+        context_window,
+        max_tokens,
+    )
+    return prompt.format(analysis=analysis, sources=packed["text"]), packed
 
 
-def synthesize(analysis: str, criticism: str, agent, context_window: int):
-    prompt = f"""Create a coherent summary that incorporates the initial analysis and the subsequent critique.
+def critisize(
+    analysis: str, context: list, agent, context_window: int, max_tokens: int = 2048
+):
+    """Critiques `analysis` against the packed sources; returns the response and packing report."""
+    prompt, packed = _critisize_prompt(
+        analysis, context, agent, context_window, max_tokens
+    )
+    response = agent.model.get_response(
+        prompt, context_window=context_window, max_tokens=max_tokens, task="critique"
+    )
+    return response, packed
+
+
+async def critisize_async(
+    analysis: str, context: list, agent, context_window: int, max_tokens: int = 2048
+):
+    prompt, packed = _critisize_prompt(
+        analysis, context, agent, context_window, max_tokens
+    )
+    response = await agent.model.aget_response(
+        prompt, context_window=context_window, max_tokens=max_tokens, task="critique"
+    )
+    return response, packed
+
+
+def _synthesize_prompt(analysis: str, criticism: str) -> str:
+    return f"""Create a coherent summary that incorporates the initial analysis and the subsequent critique.
                 Present a balanced view based on both pieces of information.
 
                 --- INITIAL ANALYSIS ---
@@ -29,20 +100,115 @@ def synthesize(analysis: str, criticism: str, agent, context_window: int):
                 --- CRITIQUE ---
                 {criticism}
                 """
-    response = agent.model.get_response(prompt, context_window=context_window)
+
+
+def synthesize(analysis: str, criticism: str, agent, context_window: int):
+    prompt = _synthesize_prompt(analysis, criticism)
+    response = agent.model.get_response(
+        prompt, context_window=context_window, task="synthesize"
+    )
     return response
 
 
-def next_step(synthesis: str, origin_topic: str, agent, context_window: int) -> str:
-    prompt = f"""
+async def synthesize_async(analysis: str, criticism: str, agent, context_window: int):
+    prompt = _synthesize_prompt(analysis, criticism)
+    return await agent.model.aget_response(
+        prompt, context_window=context_window, task="synthesize"
+    )
+
+
+def _covered_section(covered: list) -> str:
+    """Lists questions already investigated, for the explorer to stay away from."""
+    if not covered:
+        return ""
+    lines = "".join(f"            - {question}\n" for question in covered)
+    return f"""
+            --- ALREADY COVERED ---
+            These questions were already investigated or proposed. Do not repeat or rephrase any of them; ask about something new.
+{lines}"""
+
+
+def _next_step_prompt(synthesis: str, origin_topic: str, covered: list = None) -> str:
+    return f"""
             Based on the following research summary and critique, what are the most
-            important unanswered questions or next steps for a deeper investigation? Determine the most important details and create a question. Respond with only the question you create. 
+            important unanswered questions or next steps for a deeper investigation? Determine the most important details and create a question. Respond with only the question you create.
 
             --- SUMMARY ---
             {synthesis}
-            
-            STAY ON TOPIC WITH THE ORIGIN TOPIC: {origin_topic}                
+{_covered_section(covered)}
+            STAY ON TOPIC WITH THE ORIGIN TOPIC: {origin_topic}
             """
 
-    response = agent.model.get_response(prompt, context_window=context_window)
+
+def next_step(
+    synthesis: str, origin_topic: str, agent, context_window: int, covered: list = None
+) -> str:
+    prompt = _next_step_prompt(synthesis, origin_topic, covered)
+
+    response = agent.model.get_response(
+        prompt, context_window=context_window, task="next_step"
+    )
     return response
+
+
+async def next_step_async(
+    synthesis: str, origin_topic: str, agent, context_window: int, covered: list = None
+) -> str:
+    prompt = _next_step_prompt(synthesis, origin_topic, covered)
+    return await agent.model.aget_response(
+        prompt, context_window=context_window, task="next_step"
+    )
+
+
+def _next_steps_prompt(
+    synthesis: str, origin_topic: str, count: int, covered: list = None
+) -> str:
+    return f"""
+            Based on the following research summary and critique, what are the most
+            important unanswered questions or next steps for a deeper investigation? Create {count} different questions, ranked from most to least important. Respond with only the questions, one per line, numbered 1 to {count}.
+
+            --- SUMMARY ---
+            {synthesis}
+{_covered_section(covered)}
+            STAY ON TOPIC WITH THE ORIGIN TOPIC: {origin_topic}
+            """
+
+
+def _parse_questions(response: str, count: int) -> list:
+    questions = []
+    for line in response.splitlines():
+        line = re.sub(r"^\s*(\d+[.)]|[-*])\s*", "", line).strip()
+        if line:
+            questions.append(line)
+    return questions[:count] or [response.strip()]
+
+
+def next_steps(
+    synthesis: str,
+    origin_topic: str,
+    agent,
+    context_window: int,
+    count: int = 3,
+    covered: list = None,
+) -> list:
+    """Asks the explorer for up to `count` candidate questions, best first."""
+    prompt = _next_steps_prompt(synthesis, origin_topic, count, covered)
+    response = agent.model.get_response(
+        prompt, context_window=context_window, task="next_steps"
+    )
+    return _parse_questions(response, count)
+
+
+async def next_steps_async(
+    synthesis: str,
+    origin_topic: str,
+    agent,
+    context_window: int,
+    count: int = 3,
+    covered: list = None,
+) -> list:
+    prompt = _next_steps_prompt(synthesis, origin_topic, count, covered)
+    response = await agent.model.aget_response(
+        prompt, context_window=context_window, task="next_steps"
+    )
+    return _parse_questions(response, count)
@@ -1,5 +1,5 @@
 import logging
-import os
+from config.config import read_tools_config
 from modules.research.llm import LLM
 import requests
 import json
@@ -19,6 +19,7 @@ class Agent:
         # The agent's model is now an instance of your powerful LLM class
         self.model = LLM(model_name=model_name, system_prompt=system_prompt)
         self.task_name = task_name
+        self.model.agent_name = task_name
         self.tools = {}
         logging.info(
             f"Initialized {self.__class__.__name__} with model '{model_name}'."
@@ -59,10 +60,8 @@ class Agent:
         else:
             return f"Error: Tool '{tool_name}' not found."
 
-    def load_tool_config(self) -> dict:
-        config_path = os.path.join("config", "tools_config.json")
-        with open(config_path, "r") as f:
-            return json.load(f)
+    def load_tool_config(self) -> list:
+        return read_tools_config()
 
     def run(self, prompt: str, max_turns: int = 5) -> str:
         """
@@ -0,0 +1,427 @@
+import os
+import re
+import gzip
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from config.config import read_research_config
+
+
+class PageCache:
+    """
+    Content-addressed disk cache of fetched web pages.
+
+    Raw HTML and extracted text are stored gzip-compressed under the sha256 of the
+    HTML, so identical pages served from different urls share one blob. A small
+    SQLite index maps urls to blobs and keeps the validators (ETag/Last-Modified)
+    and access times used for TTL checks and LRU eviction.
+    """
+
+    def __init__(self, root: str, ttl_hours: float = 24, max_size_mb: float = 200):
+        self.root = root
+        self.ttl = ttl_hours * 3600
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+        self._conn = sqlite3.connect(
+            os.path.join(self.root, "index.sqlite"), check_same_thread=False
+        )
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                body_hash TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                fetch_seconds REAL NOT NULL,
+                size INTEGER NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS pages_last_access ON pages (last_access)"
+        )
+        self._conn.commit()
+
+    def _blob_path(self, body_hash: str, kind: str) -> str:
+        return os.path.join(self.root, body_hash[:2], f"{body_hash}.{kind}.gz")
+
+    def _read_blob(self, body_hash: str, kind: str) -> str:
+        with gzip.open(self._blob_path(body_hash, kind), "rt", encoding="utf-8") as f:
+            return f.read()
+
+    def _write_blob(self, body_hash: str, kind: str, data: str) -> int:
+        path = self._blob_path(body_hash, kind)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return os.path.getsize(path)
+
+    def lookup(self, url: str) -> dict:
+        """
+        Returns the cached entry for `url`, or None.
+
+        The entry holds the extracted "text", the "etag"/"last_modified" validators
+        and "fresh", which is False once the entry is older than the TTL and should
+        be revalidated before use.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body_hash, etag, last_modified, fetched_at, fetch_seconds FROM pages WHERE url = ?",
+                (url,),
+            ).fetchone()
+            if row is None:
+                return None
+            body_hash, etag, last_modified, fetched_at, fetch_seconds = row
+            try:
+                text = self._read_blob(body_hash, "txt")
+            except (OSError, EOFError):
+                self._conn.execute("DELETE FROM pages WHERE url = ?", (url,))
+                self._conn.commit()
+                return None
+            fresh = time.time() - fetched_at < self.ttl
+            if fresh:
+                self.hits += 1
+                self.saved_seconds += fetch_seconds
+                self._conn.execute(
+                    "UPDATE pages SET last_access = ? WHERE url = ?", (time.time(), url)
+                )
+                self._conn.commit()
+            return {
+                "text": text,
+                "etag": etag,
+                "last_modified": last_modified,
+                "fetch_seconds": fetch_seconds,
+                "fresh": fresh,
+            }
+
+    def get_html(self, url: str) -> str:
+        """Returns the raw HTML stored for `url`, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body_hash FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            try:
+                return self._read_blob(row[0], "html")
+            except (OSError, EOFError):
+                return None
+
+    def mark_revalidated(self, url: str, fetch_seconds: float = 0.0):
+        """Refreshes a stale entry after the server answered 304 Not Modified."""
+        with self._lock:
+            now = time.time()
+            self._conn.execute(
+                "UPDATE pages SET fetched_at = ?, last_access = ? WHERE url = ?",
+                (now, now, url),
+            )
+            self._conn.commit()
+            self.revalidated += 1
+            self.saved_seconds += max(0.0, fetch_seconds)
+
+    def record_miss(self):
+        """Counts a page that had to be downloaded and parsed again."""
+        with self._lock:
+            self.misses += 1
+
+    def store(
+        self,
+        url: str,
+        html: str,
+        text: str,
+        etag: str = None,
+        last_modified: str = None,
+        fetch_seconds: float = 0.0,
+    ):
+        """Stores a fetched page and evicts least recently used pages over the size cap."""
+        body_hash = hashlib.sha256(html.encode("utf-8", errors="replace")).hexdigest()
+        with self._lock:
+            size = self._write_blob(body_hash, "html", html)
+            size += self._write_blob(body_hash, "txt", text)
+            now = time.time()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, body_hash, etag, last_modified, now, now, fetch_seconds, size),
+            )
+            self._conn.commit()
+            self._evict()
+
+    def _evict(self):
+        rows = self._conn.execute(
+            "SELECT url, body_hash, size FROM pages ORDER BY last_access DESC"
+        ).fetchall()
+        total = 0
+        seen = set()
+        evicted = []
+        for url, body_hash, size in rows:
+            if body_hash not in seen:
+                total += size
+            if total > self.max_size:
+                evicted.append((url, body_hash))
+            else:
+                seen.add(body_hash)
+        if not evicted:
+            return
+        self._conn.executemany(
+            "DELETE FROM pages WHERE url = ?", [(url,) for url, _ in evicted]
+        )
+        self._conn.commit()
+        for _, body_hash in evicted:
+            if body_hash in seen:
+                continue
+            seen.add(body_hash)
+            for kind in ("html", "txt"):
+                try:
+                    os.remove(self._blob_path(body_hash, kind))
+                except OSError:
+                    pass
+        logging.info(f"Page cache evicted {len(evicted)} pages")
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "saved_seconds": round(self.saved_seconds, 2),
+        }
+
+
+# Words dropped when normalizing search queries; they rarely change the results.
+QUERY_STOPWORDS = {
+    "a", "an", "and", "the", "of", "in", "on", "for", "to", "is", "are",
+    "what", "how", "why", "which", "with", "about", "me", "find",
+}
+
+
+class SearchCache:
+    """
+    Persistent cache of search result urls keyed by normalized query and result count.
+
+    Recently issued queries are also kept in memory, so repeating one within a
+    session never touches disk or the network. Both copies expire after the TTL.
+    """
+
+    def __init__(self, path: str, ttl_hours: float = 12):
+        self.ttl = ttl_hours * 3600
+        self.hits = 0
+        self.misses = 0
+        self._session = {}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS searches (
+                key TEXT PRIMARY KEY,
+                query TEXT NOT NULL,
+                urls TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            )"""
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """
+        Lowercases the query and strips punctuation and stopwords, keeping word order.
+
+        Word order matters ("python vs rust" is not "rust vs python"), and a
+        query with no words left, e.g. only stopwords, keys on its raw text.
+        """
+        terms = re.findall(r"\w+", query.lower())
+        normalized = " ".join(t for t in terms if t not in QUERY_STOPWORDS)
+        return normalized or query.lower().strip()
+
+    def _key(self, query: str, num_results: int) -> str:
+        return f"{self.normalize_query(query)}|{num_results}"
+
+    def get(self, query: str, num_results: int) -> list:
+        """Returns the cached urls for `query`, or None on a miss."""
+        key = self._key(query, num_results)
+        with self._lock:
+            if key in self._session:
+                urls, fetched_at = self._session[key]
+                if time.time() - fetched_at < self.ttl:
+                    self.hits += 1
+                    logging.info(f"Search cache hit (session) for '{query}'")
+                    return list(urls)
+                del self._session[key]
+            row = self._conn.execute(
+                "SELECT urls, fetched_at FROM searches WHERE key = ?", (key,)
+            ).fetchone()
+            if row and time.time() - row[1] < self.ttl:
+                urls = json.loads(row[0])
+                self._session[key] = (urls, row[1])
+                self.hits += 1
+                logging.info(f"Search cache hit for '{query}'")
+                return list(urls)
+            self.misses += 1
+            logging.info(f"Search cache miss for '{query}'")
+            return None
+
+    def put(self, query: str, num_results: int, urls: list):
+        key = self._key(query, num_results)
+        now = time.time()
+        with self._lock:
+            # Drop expired entries, so a long-lived process does not keep them all.
+            self._session = {
+                k: v for k, v in self._session.items() if now - v[1] < self.ttl
+            }
+            self._session[key] = (list(urls), now)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO searches VALUES (?, ?, ?, ?)",
+                (key, query, json.dumps(urls), now),
+            )
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+class ResponseCache:
+    """
+    Persistent cache of LLM replies keyed by a hash of the full request.
+
+    Entries are evicted least recently used first once the stored replies exceed
+    the size cap.
+    """
+
+    def __init__(self, path: str, max_size_mb: float = 50):
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> str:
+        """Returns the cached reply for `key`, or None on a miss."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute(
+                "UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key: str, model: str, response: str):
+        size = len(response.encode("utf-8", errors="replace"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, size, time.time()),
+            )
+            self._conn.commit()
+            self._evict()
+
+    def _evict(self):
+        rows = self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY last_access DESC"
+        ).fetchall()
+        total = 0
+        evicted = []
+        for key, size in rows:
+            total += size
+            if total > self.max_size:
+                evicted.append((key,))
+        if evicted:
+            self._conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+            self._conn.commit()
+            logging.info(f"Response cache evicted {len(evicted)} replies")
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+_page_cache = None
+_page_cache_lock = threading.Lock()
+
+
+def get_page_cache() -> PageCache:
+    """Returns the shared page cache, or None when it is disabled in research_config.json."""
+    global _page_cache
+    with _page_cache_lock:
+        if _page_cache is None:
+            research_config = read_research_config()
+            cache_config = research_config.get("page_cache", {})
+            if not cache_config.get("enabled", True):
+                return None
+            _page_cache = PageCache(
+                os.path.join(research_config["research_output"], "cache", "pages"),
+                ttl_hours=cache_config.get("ttl_hours", 24),
+                max_size_mb=cache_config.get("max_size_mb", 200),
+            )
+        return _page_cache
+
+
+_search_cache = None
+_search_cache_lock = threading.Lock()
+
+
+def get_search_cache() -> SearchCache:
+    """Returns the shared search cache, or None when it is disabled in research_config.json."""
+    global _search_cache
+    with _search_cache_lock:
+        if _search_cache is None:
+            research_config = read_research_config()
+            cache_config = research_config.get("search_cache", {})
+            if not cache_config.get("enabled", True):
+                return None
+            _search_cache = SearchCache(
+                os.path.join(
+                    research_config["research_output"], "cache", "searches.sqlite"
+                ),
+                ttl_hours=cache_config.get("ttl_hours", 12),
+            )
+        return _search_cache
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Returns the shared LLM response cache, or None when it is disabled in research_config.json."""
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            research_config = read_research_config()
+            cache_config = research_config.get("llm_cache", {})
+            if not cache_config.get("enabled", False):
+                return None
+            _response_cache = ResponseCache(
+                os.path.join(
+                    research_config["research_output"], "cache", "responses.sqlite"
+                ),
+                max_size_mb=cache_config.get("max_size_mb", 50),
+            )
+        return _response_cache
@@ -0,0 +1,110 @@
+import os
+import json
+import logging
+import threading
+import datetime as dt
+
+# A session checkpoint is a JSONL file with one event per completed stage:
+#
+#   {"type": "start", "mode": "linear" | "tree", "topic": ..., <run arguments>}
+#   {"type": "stage", "label": "2", "stage": "sources" | "analysis" | "criticism"
+#       | "synthesis", "data": {...}, "agent": "analyst", "history": [...]}
+#   {"type": "record", "record": {...}, "calls": [...], "current_topic": ...,
+#       "agents": {name: history}}
+#   {"type": "resume"}
+#   {"type": "finish", "report": ...}
+#
+# "history" and "agents" hold the agents' working histories, which is what a
+# resumed run needs. Under the compact history policy, turns that were already
+# summarized appear only as that summary; their full text is not checkpointed.
+#
+# Every event is written as a single line and flushed to disk before the run
+# moves on, so a crash loses at most the stage that was in progress; a torn
+# last line is ignored when the session is loaded.
+
+
+class Checkpoint:
+    """Appends the events of one research session to its JSONL file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def append(self, event: dict):
+        event = {**event, "time": dt.datetime.now().isoformat()}
+        line = json.dumps(event, ensure_ascii=False) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def read_events(path: str) -> list:
+    """Reads the events of a session, skipping a last line torn by a crash."""
+    events = []
+    with open(path, "r", encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    for n, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            events.append(json.loads(line))
+        except json.JSONDecodeError:
+            if n < len(lines):
+                raise
+            logging.warning(f"Ignoring incomplete last line of {path}")
+    return events
+
+
+def load_session(path: str) -> dict:
+    """
+    Folds the events of a session into the state a resumed run starts from.
+
+    Returns {"path", "start", "records", "stages", "sources", "agents",
+    "current_topic", "calls", "report"}. "records" are the completed iterations
+    or tree nodes in the order they finished; "stages" maps the label of every
+    unfinished iteration or node to its completed stages; "sources" lists the
+    content of every sources stage in the order it was indexed; "agents" holds
+    the latest history of each main agent of a linear run.
+    """
+    events = read_events(path)
+    if not events or events[0].get("type") != "start":
+        raise ValueError(f"{path} is not a research session checkpoint")
+    session = {
+        "path": path,
+        "start": events[0],
+        "records": [],
+        "stages": {},
+        "sources": [],
+        "agents": {},
+        "current_topic": events[0]["topic"],
+        "calls": [],
+        "report": None,
+    }
+    for event in events[1:]:
+        kind = event.get("type")
+        if kind == "stage":
+            session["stages"].setdefault(event["label"], {})[event["stage"]] = event
+            if event["stage"] == "sources":
+                session["sources"].extend(event["data"]["content"])
+            if event.get("agent"):
+                session["agents"][event["agent"]] = event.get("history", [])
+        elif kind == "record":
+            record = event["record"]
+            label = record.get("node_id", str(len(session["records"]) + 1))
+            session["stages"].pop(label, None)
+            session["records"].append(record)
+            session["calls"].extend(event.get("calls", []))
+            session["current_topic"] = event.get(
+                "current_topic", session["current_topic"]
+            )
+            session["agents"].update(event.get("agents", {}))
+        elif kind == "finish":
+            session["report"] = event.get("report")
+    return session
+
+
+def session_path(output_dir: str, name: str) -> str:
+    return os.path.join(output_dir, "sessions", f"{name}.jsonl")
@@ -0,0 +1,149 @@
+import logging
+
+# Rough characters-per-token ratios by model family for English web text.
+# Unknown models use the default, which errs on the side of overestimating.
+CHARS_PER_TOKEN = {
+    "llama": 3.8,
+    "mistral": 3.6,
+    "mixtral": 3.6,
+    "qwen": 3.5,
+    "gemma": 4.0,
+    "phi": 3.6,
+    "deepseek": 3.6,
+}
+DEFAULT_CHARS_PER_TOKEN = 3.3
+# Tokens added by the chat template around every message.
+MESSAGE_OVERHEAD_TOKENS = 4
+# Headroom for estimation error so a packed prompt never overflows num_ctx.
+SAFETY_MARGIN = 0.05
+# Sources that would get fewer tokens than this are dropped instead of truncated.
+MIN_SOURCE_TOKENS = 32
+
+
+def chars_per_token(model_name: str = "") -> float:
+    model_name = model_name.lower()
+    for family, ratio in CHARS_PER_TOKEN.items():
+        if family in model_name:
+            return ratio
+    return DEFAULT_CHARS_PER_TOKEN
+
+
+def estimate_tokens(text: str, model_name: str = "") -> int:
+    """Estimates how many tokens `text` takes for the given model."""
+    if not text:
+        return 0
+    return int(len(text) / chars_per_token(model_name)) + 1
+
+
+def estimate_messages_tokens(messages: list, model_name: str = "") -> int:
+    """Estimates the prompt tokens of a chat message list."""
+    return sum(
+        estimate_tokens(str(m.get("content") or ""), model_name)
+        + MESSAGE_OVERHEAD_TOKENS
+        for m in messages
+    )
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    """Cuts `text` to `max_chars`, backing up to a sentence end when one is close."""
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    sentence_end = cut.rfind(". ")
+    if sentence_end > max_chars * 0.8:
+        cut = cut[: sentence_end + 1]
+    return cut
+
+
+def pack_context(sources: list, budget_tokens: int, model_name: str = "") -> dict:
+    """
+    Fits source texts into a token budget with a fair per-source allocation.
+
+    `sources` is a list of {"url", "text"} dicts. The budget is split with
+    max-min fairness: sources smaller than an equal share are kept whole and the
+    remainder is shared among the larger ones, which are truncated to their share.
+    Sources whose share falls below MIN_SOURCE_TOKENS are dropped.
+
+    Returns {"text", "tokens", "included", "dropped"}; "included" lists the url,
+    tokens and whether each kept source was truncated, "dropped" the url and tokens
+    of each source left out.
+    """
+    ratio = chars_per_token(model_name)
+    sizes = []
+    for index, source in enumerate(sources):
+        header = f"[Source: {source.get('url', index + 1)}]\n"
+        sizes.append(
+            (
+                estimate_tokens(source["text"], model_name),
+                estimate_tokens(header, model_name),
+                index,
+            )
+        )
+
+    allocation = {}
+    remaining_budget = max(0, budget_tokens)
+    pending = sorted(s for s in sizes if s[0] > 0)
+    while pending:
+        share = remaining_budget // len(pending)
+        tokens, header_tokens, index = pending[0]
+        if tokens + header_tokens <= share:
+            allocation[index] = tokens
+            remaining_budget -= tokens + header_tokens
+            pending.pop(0)
+            continue
+        # Every remaining source is larger than an equal share: truncate them all.
+        for tokens, header_tokens, index in pending:
+            allocation[index] = max(0, share - header_tokens)
+        break
+
+    parts = []
+    included = []
+    dropped = []
+    total = 0
+    for tokens, header_tokens, index in sizes:
+        source = sources[index]
+        url = source.get("url", index + 1)
+        allowed = allocation.get(index, 0)
+        if tokens == 0:
+            continue
+        if allowed < min(tokens, MIN_SOURCE_TOKENS):
+            dropped.append({"url": url, "tokens": tokens})
+            continue
+        text = _truncate(source["text"], int(allowed * ratio))
+        used = estimate_tokens(text, model_name) + header_tokens
+        parts.append(f"[Source: {url}]\n{text}")
+        included.append(
+            {"url": url, "tokens": used, "truncated": len(text) < len(source["text"])}
+        )
+        total += used
+    return {
+        "text": "\n\n".join(parts),
+        "tokens": total,
+        "included": included,
+        "dropped": dropped,
+    }
+
+
+def pack_prompt(
+    agent, instructions: str, sources: list, context_window: int, max_tokens: int
+) -> dict:
+    """
+    Packs `sources` into whatever room `agent` has left for a single call.
+
+    The system prompt and earlier turns the agent's history policy will send, the
+    `instructions` around the sources and the `max_tokens` reserved for the reply
+    are subtracted from `context_window` first.
+    """
+    model_name = agent.model.model_name
+    reserved = (
+        estimate_messages_tokens(agent.model.context_messages(), model_name)
+        + estimate_tokens(instructions, model_name)
+        + MESSAGE_OVERHEAD_TOKENS
+        + max_tokens
+    )
+    budget = int(context_window * (1 - SAFETY_MARGIN)) - reserved
+    packed = pack_context(sources, budget, model_name)
+    logging.info(
+        f"{agent.task_name}: packed {len(packed['included'])} sources ({packed['tokens']} tokens, budget {budget}), dropped {len(packed['dropped'])}"
+    )
+    return packed
@@ -0,0 +1,262 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+import weakref
+import zlib
+from typing import Iterator
+from urllib.parse import urlsplit
+import httpx
+import ollama
+from config.config import read_settings
+from modules.research.tools import get_http_session
+
+# Errors that mean the endpoint itself is unreachable, as opposed to the model
+# rejecting the request; only these trigger a failover.
+ENDPOINT_ERRORS = (ConnectionError, httpx.TransportError)
+
+ROUTING_STRATEGIES = ("least_loaded", "model_affinity")
+
+
+def host_url(host: str = None) -> str:
+    """
+    Returns the base URL of an Ollama host setting: "gpu-box" -> "http://gpu-box:11434".
+
+    None means the ollama default: OLLAMA_HOST or 127.0.0.1:11434. Follows the
+    ollama client's own parsing, so the URL names the server it talks to.
+    """
+    host = host or os.getenv("OLLAMA_HOST") or ""
+    scheme, _, hostport = host.partition("://")
+    port = {"http": 80, "https": 443}.get(scheme, 11434) if hostport else 11434
+    if not hostport:
+        scheme, hostport = "http", host
+    split = urlsplit(f"{scheme}://{hostport}")
+    name = split.hostname or "127.0.0.1"
+    if ":" in name:
+        name = f"[{name}]"
+    url = f"{scheme}://{name}:{split.port or port}"
+    path = split.path.strip("/")
+    return f"{url}/{path}" if path else url
+
+
+class Endpoint:
+    """One Ollama host with its clients, health state and in-flight call count."""
+
+    def __init__(self, host: str = None):
+        self.host = host_url(host)
+        self.client = ollama.Client(host=self.host)
+        self.healthy = True
+        self.in_flight = 0
+        self.failures = 0
+        self.checked_at = 0.0
+        self.models = set()
+        self.resident = set()
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def async_client(self) -> ollama.AsyncClient:
+        """Returns this endpoint's AsyncClient for the running event loop."""
+        loop = asyncio.get_running_loop()
+        if loop not in self._async_clients:
+            self._async_clients[loop] = ollama.AsyncClient(host=self.host)
+        return self._async_clients[loop]
+
+    async def aclose(self):
+        """Closes the running loop's AsyncClient, if it has one."""
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.close()
+
+    def check(self, timeout: float = 2) -> bool:
+        """Asks the endpoint for its version, models and resident models."""
+        session = get_http_session()
+        try:
+            session.get(f"{self.host}/api/version", timeout=timeout).raise_for_status()
+            tags = session.get(f"{self.host}/api/tags", timeout=timeout).json()
+            self.models = {m["model"] for m in tags.get("models", [])}
+            ps = session.get(f"{self.host}/api/ps", timeout=timeout).json()
+            self.resident = {m["model"] for m in ps.get("models", [])}
+            self.healthy = True
+        except Exception as e:
+            if self.healthy:
+                logging.warning(f"Ollama endpoint {self.host} is unhealthy: {e}")
+            self.healthy = False
+        self.checked_at = time.time()
+        return self.healthy
+
+    def status(self) -> dict:
+        return {
+            "host": self.host,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "failures": self.failures,
+            "models": sorted(self.models),
+            "resident": sorted(self.resident),
+        }
+
+
+class EndpointPool:
+    """
+    Routes LLM calls across the Ollama endpoints configured in settings.json.
+
+    "least_loaded" sends each call to the healthy endpoint with the fewest calls
+    in flight, preferring one that has the model resident on a tie.
+    "model_affinity" keeps each model on one endpoint: one that has it resident,
+    else one that has it downloaded, else a stable pick by model name, and only
+    breaks ties by load. Unhealthy endpoints are skipped until a health check,
+    at most every `health_check_seconds`, finds them up again. A call whose
+    endpoint is unreachable is retried on the next candidate.
+    """
+
+    def __init__(
+        self,
+        hosts: list,
+        routing: str = "least_loaded",
+        health_check_seconds: float = 30,
+    ):
+        if routing not in ROUTING_STRATEGIES:
+            raise ValueError(f"Unknown routing strategy: {routing}")
+        self.endpoints = [Endpoint(host) for host in hosts or [None]]
+        self.routing = routing
+        self.health_check_seconds = health_check_seconds
+        self._lock = threading.Lock()
+
+    def _check_due(self, endpoint: Endpoint) -> bool:
+        return time.time() - endpoint.checked_at > self.health_check_seconds
+
+    def health_check_due(self) -> bool:
+        """Whether any endpoint's last check is older than health_check_seconds."""
+        return any(self._check_due(endpoint) for endpoint in self.endpoints)
+
+    def check_health(self, force: bool = False):
+        """Re-checks endpoints whose last check is older than health_check_seconds."""
+        for endpoint in self.endpoints:
+            if force or self._check_due(endpoint):
+                endpoint.check()
+
+    def _rank(self, endpoint: Endpoint, model_name: str) -> tuple:
+        resident = model_name in endpoint.resident
+        if self.routing == "least_loaded":
+            return (endpoint.in_flight, not resident)
+        available = model_name in endpoint.models
+        index = self.endpoints.index(endpoint)
+        preferred = index == zlib.crc32(model_name.encode()) % len(self.endpoints)
+        return (not resident, not available, not preferred, endpoint.in_flight)
+
+    def acquire(self, model_name: str, exclude: list = ()) -> Endpoint:
+        """Picks the endpoint for one call to `model_name` and counts the call on it."""
+        with self._lock:
+            candidates = [e for e in self.endpoints if e not in exclude]
+            healthy = [e for e in candidates if e.healthy]
+            if not candidates:
+                raise ConnectionError(
+                    f"No Ollama endpoint left to try for {model_name}"
+                )
+            # With every endpoint marked down, try them anyway rather than fail.
+            endpoint = min(
+                healthy or candidates, key=lambda e: self._rank(e, model_name)
+            )
+            endpoint.in_flight += 1
+            return endpoint
+
+    def release(self, endpoint: Endpoint):
+        with self._lock:
+            endpoint.in_flight -= 1
+
+    def mark_failed(self, endpoint: Endpoint, error: Exception):
+        with self._lock:
+            endpoint.healthy = False
+            endpoint.failures += 1
+            endpoint.checked_at = time.time()
+        logging.warning(f"Ollama endpoint {endpoint.host} failed: {error}")
+
+    def call(self, model_name: str, fn, can_retry=None):
+        """
+        Runs `fn(client)` against the chosen endpoint's ollama.Client.
+
+        When the endpoint is unreachable the call moves to the next candidate,
+        unless `can_retry()` says the failed attempt already had visible effects.
+        """
+        tried = []
+        while True:
+            self.check_health()
+            endpoint = self.acquire(model_name, tried)
+            try:
+                result = fn(endpoint.client)
+                endpoint.resident.add(model_name)
+                return result
+            except ENDPOINT_ERRORS as e:
+                self._fail_over(endpoint, e, tried, can_retry)
+            finally:
+                self.release(endpoint)
+
+    async def acall(self, model_name: str, fn, can_retry=None):
+        """Async variant of call; `fn` receives an ollama.AsyncClient and is awaited."""
+        tried = []
+        while True:
+            # Health checks block on HTTP, so they run off the loop, and only when
+            # one is due; acquire does not block.
+            if self.health_check_due():
+                await asyncio.to_thread(self.check_health)
+            endpoint = self.acquire(model_name, tried)
+            try:
+                result = await fn(endpoint.async_client())
+                endpoint.resident.add(model_name)
+                return result
+            except ENDPOINT_ERRORS as e:
+                self._fail_over(endpoint, e, tried, can_retry)
+            finally:
+                self.release(endpoint)
+
+    def stream(self, model_name: str, fn) -> Iterator:
+        """Yields from `fn(client)`, failing over only while nothing was yielded yet."""
+        tried = []
+        while True:
+            self.check_health()
+            endpoint = self.acquire(model_name, tried)
+            started = False
+            try:
+                for item in fn(endpoint.client):
+                    started = True
+                    yield item
+                endpoint.resident.add(model_name)
+                return
+            except ENDPOINT_ERRORS as e:
+                self._fail_over(endpoint, e, tried, lambda: not started)
+            finally:
+                self.release(endpoint)
+
+    def _fail_over(self, endpoint: Endpoint, error: Exception, tried: list, can_retry):
+        """Marks `endpoint` down and re-raises unless another endpoint may take the call."""
+        self.mark_failed(endpoint, error)
+        tried.append(endpoint)
+        if len(tried) == len(self.endpoints) or (
+            can_retry is not None and not can_retry()
+        ):
+            raise error
+
+    async def aclose(self):
+        """Closes every endpoint's AsyncClient for the running loop."""
+        for endpoint in self.endpoints:
+            await endpoint.aclose()
+
+    def status(self) -> list:
+        return [endpoint.status() for endpoint in self.endpoints]
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> EndpointPool:
+    """Returns the shared endpoint pool built from the "ollama" section of settings.json."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            config = read_settings().get("ollama", {})
+            _pool = EndpointPool(
+                [e.get("host") for e in config.get("endpoints", [])],
+                routing=config.get("routing", "least_loaded"),
+                health_check_seconds=config.get("health_check_seconds", 30),
+            )
+        return _pool
@@ -1,22 +1,117 @@
 import json
+import time
+import asyncio
+import hashlib
 import logging
+from typing import Iterator
 import ollama
 import datetime as dt
 import requests
+from modules.research.cache import get_response_cache
+from modules.research.context import chars_per_token, estimate_messages_tokens
+from modules.research.endpoints import get_pool
+from modules.research.scheduler import (
+    LOAD_THRESHOLD_SECONDS,
+    get_keep_alive,
+    get_scheduler,
+)
+from modules.research.tools import get_http_session
+
+
+def response_cache_key(model_name: str, model_options: dict, messages: list) -> str:
+    """Hashes everything that determines a reply: the model, its options and the messages."""
+    payload = json.dumps(
+        {"model": model_name, "options": model_options, "messages": messages},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# What each history policy sends ahead of a new prompt:
+#   full      - the whole conversation
+#   stateless - the system prompt only
+#   window    - the most recent turns that fit in `history_budget` tokens
+#   compact   - like window, but older turns are summarized instead of dropped
+HISTORY_POLICIES = ("full", "stateless", "window", "compact")
+
+
+def summarize_calls(calls: list) -> dict:
+    """Adds up LLM.calls records, in total and per agent."""
+
+    def total(group: list) -> dict:
+        summary = {
+            "calls": len(group),
+            "cached": sum(1 for c in group if c["cached"]),
+        }
+        for field in (
+            "prompt_tokens",
+            "completion_tokens",
+            "load_seconds",
+            "prompt_eval_seconds",
+            "eval_seconds",
+            "wall_seconds",
+        ):
+            summary[field] = round(sum(c[field] for c in group), 3)
+        summary["tokens_per_second"] = (
+            round(summary["completion_tokens"] / summary["eval_seconds"], 1)
+            if summary["eval_seconds"]
+            else None
+        )
+        return summary
+
+    summary = total(calls)
+    agents = dict.fromkeys(c["agent"] for c in calls)
+    summary["by_agent"] = {
+        agent: total([c for c in calls if c["agent"] == agent]) for agent in agents
+    }
+    return summary
 
 
 class LLM:
     """Enhanced version of OllamaModel with research-specific features"""
 
-    def __init__(self, model_name: str, system_prompt: str, history: list = None):
+    def __init__(
+        self,
+        model_name: str,
+        system_prompt: str,
+        history: list = None,
+        history_policy: str = "full",
+        history_budget: int = 2048,
+    ):
         self.model_name = model_name
         self.system_prompt = system_prompt
         self.history = history or []
+        # Turns the compact policy replaced with a summary, oldest first; see transcript.
+        self.compacted_turns = []
         self.conversation_id = dt.datetime.now().isoformat()
+        # Called with every token delta when set; see get_response.
+        self.token_callback = None
+        self.last_ttft = None
+        self.last_prompt_tokens = 0
+        self.last_load_duration = 0.0
+        self._keep_stats({})
+        # Name of the agent that owns this LLM, and one accounting record per call.
+        self.agent_name = ""
+        self.calls = []
+        # Seconds an async generation may run before it is cut off; None waits.
+        self.timeout = None
+        self._partial = []
+        # Serve byte-identical requests from the response cache; see _cache_lookup.
+        self.use_cache = False
+        self.set_history_policy(history_policy, history_budget)
 
         if not self.history:
             self.history.append({"role": "system", "content": self.system_prompt})
 
+    def set_history_policy(self, policy: str, budget: int = None):
+        """Chooses which earlier turns are sent with each prompt; see HISTORY_POLICIES."""
+        if policy not in HISTORY_POLICIES:
+            raise ValueError(f"Unknown history policy: {policy}")
+        self.history_policy = policy
+        if budget is not None:
+            self.history_budget = budget
+
     def get_response(
         self,
         prompt: str,
@@ -24,10 +119,19 @@ class LLM:
         top_p: float = 0.9,
         context_window: int = 4096,
         max_tokens: int = 2048,
+        task: str = "",
     ) -> str:
-        """Enhanced response method with better error handling and logging"""
+        """
+        Enhanced response method with better error handling and logging.
+
+        When `token_callback` is set the reply is streamed and every token delta is
+        passed to it as it arrives. `task` labels the call in `calls`.
+        """
         try:
-            self.history.append({"role": "user", "content": prompt})
+            compaction = self._compaction_request(context_window)
+            if compaction:
+                self._apply_compaction(compaction, self._summarize(compaction))
+            messages = self._prepare_messages(prompt, context_window)
 
             model_options = {
                 "temperature": temperature,
@@ -36,18 +140,430 @@ class LLM:
                 "num_predict": max_tokens,
             }
 
-            response = ollama.chat(
-                model=self.model_name, messages=self.history, options=model_options
-            )
-            assistant_reply = response["message"]["content"]
+            start = time.time()
+            key, assistant_reply = self._cache_lookup(messages, model_options)
+            cached = assistant_reply is not None
+            if not cached:
+                if self.token_callback:
+                    parts = []
+                    for delta in self._chat_stream(messages, model_options):
+                        parts.append(delta)
+                        self.token_callback(delta)
+                    assistant_reply = "".join(parts)
+                else:
+                    response = get_pool().call(
+                        self.model_name,
+                        lambda client: client.chat(
+                            model=self.model_name,
+                            messages=messages,
+                            options=model_options,
+                            keep_alive=get_keep_alive(),
+                        ),
+                    )
+                    self._keep_stats(response)
+                    assistant_reply = response["message"]["content"]
+                self._cache_store(key, assistant_reply)
+            self._record_call(task, model_options, start, cached)
+            self.history.append({"role": "assistant", "content": assistant_reply})
+
+            return assistant_reply
+
+        except Exception as e:
+            logging.error(f"Error getting response from {self.model_name}: {e}")
+            return f"Error: {str(e)}"
+
+    def stream_response(
+        self,
+        prompt: str,
+        temperature: float = 0.5,
+        top_p: float = 0.9,
+        context_window: int = 4096,
+        max_tokens: int = 2048,
+        task: str = "",
+    ) -> Iterator[str]:
+        """
+        Yields the reply to `prompt` as token deltas while the model generates it.
+
+        The complete reply is added to the history once the stream is exhausted.
+        """
+        compaction = self._compaction_request(context_window)
+        if compaction:
+            self._apply_compaction(compaction, self._summarize(compaction))
+        messages = self._prepare_messages(prompt, context_window)
+        model_options = {
+            "temperature": temperature,
+            "top_p": top_p,
+            "num_ctx": context_window,
+            "num_predict": max_tokens,
+        }
+        start = time.time()
+        parts = []
+        for delta in self._chat_stream(messages, model_options):
+            parts.append(delta)
+            yield delta
+        self._record_call(task, model_options, start)
+        self.history.append({"role": "assistant", "content": "".join(parts)})
+
+    async def aget_response(
+        self,
+        prompt: str,
+        temperature: float = 0.5,
+        top_p: float = 0.9,
+        context_window: int = 4096,
+        max_tokens: int = 2048,
+        task: str = "",
+        timeout: float = None,
+    ) -> str:
+        """
+        Async variant of get_response built on ollama.AsyncClient.
+
+        Shares the history, options and token streaming behaviour of get_response,
+        so the two can be mixed on one LLM. Generation stops after `timeout`
+        seconds (default: the LLM's `timeout`) and whatever was streamed so far
+        becomes the reply. Cancelling the call closes the request, which makes
+        Ollama stop generating.
+        """
+        try:
+            compaction = self._compaction_request(context_window)
+            if compaction:
+                self._apply_compaction(compaction, await self._asummarize(compaction))
+            messages = self._prepare_messages(prompt, context_window)
+
+            model_options = {
+                "temperature": temperature,
+                "top_p": top_p,
+                "num_ctx": context_window,
+                "num_predict": max_tokens,
+            }
+
+            start = time.time()
+            key, assistant_reply = self._cache_lookup(messages, model_options)
+            cached = assistant_reply is not None
+            if not cached:
+                timeout = self.timeout if timeout is None else timeout
+                async with get_scheduler().slot(self.model_name):
+                    try:
+                        assistant_reply = await asyncio.wait_for(
+                            self._achat(messages, model_options), timeout
+                        )
+                        self._cache_store(key, assistant_reply)
+                    except asyncio.TimeoutError:
+                        assistant_reply = self._timed_out_reply(timeout)
+            self._record_call(task, model_options, start, cached)
             self.history.append({"role": "assistant", "content": assistant_reply})
 
             return assistant_reply
 
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
             logging.error(f"Error getting response from {self.model_name}: {e}")
             return f"Error: {str(e)}"
 
+    def _split_history(self):
+        """Returns the leading system message (as a list) and the turns after it."""
+        if self.history and self.history[0]["role"] == "system":
+            return self.history[:1], self.history[1:]
+        return [], self.history
+
+    def _fit_turns(self, turns: list, budget: int) -> list:
+        """Returns the most recent `turns` that fit in `budget` tokens, starting at a user turn."""
+        used = 0
+        start = len(turns)
+        while start > 0:
+            tokens = estimate_messages_tokens(turns[start - 1 : start], self.model_name)
+            if used + tokens > budget:
+                break
+            used += tokens
+            start -= 1
+        while start < len(turns) and turns[start]["role"] == "assistant":
+            start += 1
+        return turns[start:]
+
+    def context_messages(self) -> list:
+        """Returns the messages the history policy sends ahead of the next prompt."""
+        system, turns = self._split_history()
+        if self.history_policy == "stateless":
+            turns = []
+        elif self.history_policy in ("window", "compact"):
+            turns = self._fit_turns(turns, self.history_budget)
+        return system + turns
+
+    def _prepare_messages(self, prompt: str, context_window: int) -> list:
+        """Adds `prompt` to the history and returns the messages to send for it."""
+        messages = self.context_messages() + [{"role": "user", "content": prompt}]
+        self.history.append(messages[-1])
+        self.last_prompt_tokens = estimate_messages_tokens(messages, self.model_name)
+        logging.info(
+            f"{self.model_name}: prompt ~{self.last_prompt_tokens} tokens in {len(messages)} messages ({self.history_policy} history, num_ctx {context_window})"
+        )
+        if self.last_prompt_tokens > context_window:
+            logging.warning(
+                f"{self.model_name}: prompt likely overflows num_ctx {context_window}"
+            )
+        return messages
+
+    def _compaction_request(self, context_window: int) -> dict:
+        """
+        Returns what to summarize before the next prompt, or None.
+
+        Only the compact policy summarizes, and only once the earlier turns no
+        longer fit in `history_budget`. The most recent turns that fit in half the
+        budget are kept as they are; the rest is folded into one summary.
+        """
+        if self.history_policy != "compact":
+            return None
+        system, turns = self._split_history()
+        if estimate_messages_tokens(turns, self.model_name) <= self.history_budget:
+            return None
+        recent = self._fit_turns(turns, self.history_budget // 2)
+        older = turns[: len(turns) - len(recent)]
+        transcript = "\n\n".join(f"{m['role']}: {m['content']}" for m in older)
+        # Keep the newest part of the transcript if it would not fit the summarizer.
+        max_chars = int(context_window * chars_per_token(self.model_name) * 0.6)
+        return {
+            "system": system,
+            "recent": recent,
+            "older": older,
+            "summarized": len(older),
+            "messages": [
+                {
+                    "role": "user",
+                    "content": f"Summarize the conversation below in at most {self.history_budget // 4} words. Keep facts, figures, sources and open questions; drop pleasantries.\n\n{transcript[-max_chars:]}",
+                }
+            ],
+            "options": {
+                "temperature": 0.2,
+                "num_ctx": context_window,
+                "num_predict": self.history_budget // 2,
+            },
+        }
+
+    def _summarize(self, compaction: dict) -> str:
+        try:
+            start = time.time()
+            response = get_pool().call(
+                self.model_name,
+                lambda client: client.chat(
+                    model=self.model_name,
+                    messages=compaction["messages"],
+                    options=compaction["options"],
+                    keep_alive=get_keep_alive(),
+                ),
+            )
+            self._keep_stats(response)
+            self._record_call("compact_history", compaction["options"], start)
+            return response["message"]["content"]
+        except Exception as e:
+            logging.warning(f"Could not compact history of {self.model_name}: {e}")
+            return None
+
+    async def _asummarize(self, compaction: dict) -> str:
+        try:
+            start = time.time()
+            scheduler = get_scheduler()
+            async with scheduler.slot(self.model_name):
+                response = await get_pool().acall(
+                    self.model_name,
+                    lambda client: client.chat(
+                        model=self.model_name,
+                        messages=compaction["messages"],
+                        options=compaction["options"],
+                        keep_alive=scheduler.keep_alive,
+                    ),
+                )
+            self._keep_stats(response)
+            scheduler.record(self.model_name, self.last_load_duration)
+            self._record_call("compact_history", compaction["options"], start)
+            return response["message"]["content"]
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.warning(f"Could not compact history of {self.model_name}: {e}")
+            return None
+
+    def _apply_compaction(self, compaction: dict, summary: str):
+        """Replaces the summarized turns with `summary`; they are dropped if it failed."""
+        summary_turns = []
+        if summary:
+            summary_turns = [
+                {
+                    "role": "system",
+                    "content": f"Summary of the earlier conversation:\n{summary}",
+                }
+            ]
+        # Earlier summaries are system turns; only the real turns are archived.
+        self.compacted_turns.extend(
+            m for m in compaction["older"] if m["role"] != "system"
+        )
+        self.history = compaction["system"] + summary_turns + compaction["recent"]
+        logging.info(
+            f"{self.model_name}: compacted {compaction['summarized']} turns into a summary"
+        )
+
+    def _cache_lookup(self, messages: list, model_options: dict):
+        """
+        Returns the cache key and cached reply for the pending request.
+
+        Both are None when caching is off for this LLM; the reply alone is None on
+        a miss. A hit is still passed to `token_callback` in one piece.
+        """
+        if not self.use_cache:
+            return None, None
+        cache = get_response_cache()
+        if cache is None:
+            return None, None
+        key = response_cache_key(self.model_name, model_options, messages)
+        reply = cache.get(key)
+        if reply is not None:
+            logging.info(f"{self.model_name}: reply served from the response cache")
+            self.last_ttft = 0.0
+            self._keep_stats({})
+            if self.token_callback:
+                self.token_callback(reply)
+        return key, reply
+
+    def _cache_store(self, key: str, reply: str):
+        if key is not None and reply:
+            get_response_cache().put(key, self.model_name, reply)
+
+    def _keep_stats(self, response):
+        """Keeps the token counts and durations Ollama reported for the last call."""
+        self.last_stats = {
+            "prompt_tokens": response.get("prompt_eval_count") or 0,
+            "completion_tokens": response.get("eval_count") or 0,
+            "load_seconds": (response.get("load_duration") or 0) / 1e9,
+            "prompt_eval_seconds": (response.get("prompt_eval_duration") or 0) / 1e9,
+            "eval_seconds": (response.get("eval_duration") or 0) / 1e9,
+            "total_seconds": (response.get("total_duration") or 0) / 1e9,
+        }
+        self.last_load_duration = self.last_stats["load_seconds"]
+        if self.last_load_duration >= LOAD_THRESHOLD_SECONDS:
+            logging.info(
+                f"{self.model_name}: model load took {self.last_load_duration:.2f}s"
+            )
+
+    async def _achat(self, messages: list, model_options: dict) -> str:
+        """
+        Runs one chat call on an endpoint of the pool and returns the reply.
+
+        Streams to `token_callback` when it is set, and reports the load time of
+        the call to the loop's ModelScheduler. A call whose endpoint goes down is
+        retried on another one, unless tokens were already streamed.
+        """
+        scheduler = get_scheduler()
+        self._partial = []
+
+        async def chat(client: ollama.AsyncClient) -> str:
+            if not self.token_callback:
+                response = await client.chat(
+                    model=self.model_name,
+                    messages=messages,
+                    options=model_options,
+                    keep_alive=scheduler.keep_alive,
+                )
+                self._keep_stats(response)
+                return response["message"]["content"]
+            start = time.time()
+            self.last_ttft = None
+            parts = self._partial = []
+            async for chunk in await client.chat(
+                model=self.model_name,
+                messages=messages,
+                options=model_options,
+                keep_alive=scheduler.keep_alive,
+                stream=True,
+            ):
+                if chunk.get("done"):
+                    self._keep_stats(chunk)
+                delta = chunk["message"]["content"]
+                if not delta:
+                    continue
+                if self.last_ttft is None:
+                    self.last_ttft = time.time() - start
+                    logging.info(
+                        f"{self.model_name}: first token after {self.last_ttft:.2f}s"
+                    )
+                parts.append(delta)
+                self.token_callback(delta)
+            return "".join(parts)
+
+        reply = await get_pool().acall(
+            self.model_name, chat, can_retry=lambda: not self._partial
+        )
+        scheduler.record(self.model_name, self.last_load_duration)
+        return reply
+
+    def _record_call(
+        self, task: str, model_options: dict, start: float, cached: bool = False
+    ):
+        """Appends the accounting record of the call that just finished to `calls`."""
+        stats = self.last_stats
+        record = {
+            "agent": self.agent_name,
+            "task": task,
+            "model": self.model_name,
+            "num_ctx": model_options.get("num_ctx"),
+            "cached": cached,
+            "finished": dt.datetime.now().isoformat(),
+            "prompt_tokens": stats["prompt_tokens"],
+            "completion_tokens": stats["completion_tokens"],
+            "load_seconds": round(stats["load_seconds"], 3),
+            "prompt_eval_seconds": round(stats["prompt_eval_seconds"], 3),
+            "eval_seconds": round(stats["eval_seconds"], 3),
+            "total_seconds": round(stats["total_seconds"], 3),
+            "wall_seconds": round(time.time() - start, 3),
+            "prompt_tokens_per_second": (
+                round(stats["prompt_tokens"] / stats["prompt_eval_seconds"], 1)
+                if stats["prompt_eval_seconds"]
+                else None
+            ),
+            "tokens_per_second": (
+                round(stats["completion_tokens"] / stats["eval_seconds"], 1)
+                if stats["eval_seconds"]
+                else None
+            ),
+        }
+        self.calls.append(record)
+        logging.info(
+            f"{self.agent_name or self.model_name} {task}: {record['prompt_tokens']} prompt + {record['completion_tokens']} completion tokens in {record['wall_seconds']:.2f}s"
+        )
+
+    def _timed_out_reply(self, timeout: float) -> str:
+        """Returns what was streamed before the deadline, or an error reply."""
+        self._keep_stats({})
+        partial = "".join(self._partial)
+        self._partial = []
+        logging.warning(
+            f"{self.model_name}: generation stopped after {timeout}s ({len(partial)} chars)"
+        )
+        return partial or f"Error: no reply from {self.model_name} within {timeout}s"
+
+    def _chat_stream(self, messages: list, model_options: dict) -> Iterator[str]:
+        """Streams a chat call and records the time to the first token."""
+        start = time.time()
+        self.last_ttft = None
+        for chunk in get_pool().stream(
+            self.model_name,
+            lambda client: client.chat(
+                model=self.model_name,
+                messages=messages,
+                options=model_options,
+                keep_alive=get_keep_alive(),
+                stream=True,
+            ),
+        ):
+            if chunk.get("done"):
+                self._keep_stats(chunk)
+            delta = chunk["message"]["content"]
+            if delta and self.last_ttft is None:
+                self.last_ttft = time.time() - start
+                logging.info(
+                    f"{self.model_name}: first token after {self.last_ttft:.2f}s"
+                )
+            if delta:
+                yield delta
+
     def get_response_with_tools(
         self,
         prompt: str,
@@ -74,11 +590,14 @@ class LLM:
             }
 
             # The ollama library expects the 'tools' parameter at the top level
-            response = ollama.chat(
-                model=self.model_name,
-                messages=self.history,
-                tools=tools,
-                options=model_options,
+            response = get_pool().call(
+                self.model_name,
+                lambda client: client.chat(
+                    model=self.model_name,
+                    messages=self.history,
+                    tools=tools,
+                    options=model_options,
+                ),
             )
 
             assistant_reply_message = response["message"]
@@ -102,18 +621,35 @@ class LLM:
 
     def clear_history(self, keep_system: bool = True):
         """Clear conversation history"""
+        self.compacted_turns = []
         if keep_system and self.history and self.history[0]["role"] == "system":
             self.history = [self.history[0]]
         else:
             self.history = []
 
+    def transcript(self) -> list:
+        """Returns every turn of the conversation, including those compacted away."""
+        system, turns = self._split_history()
+        if not self.compacted_turns:
+            return self.history
+        # After the system prompt comes the summary, unless summarizing failed.
+        if turns and turns[0]["role"] == "system":
+            turns = turns[1:]
+        return system + self.compacted_turns + turns
+
     def save_conversation(self, filepath: str):
-        """Save conversation history to file"""
+        """
+        Save conversation history to file
+
+        "history" is the working history that load_conversation restores, with
+        compacted turns as a summary; "transcript" has every turn as it was sent.
+        """
         conversation_data = {
             "model": self.model_name,
             "conversation_id": self.conversation_id,
             "timestamp": dt.datetime.now().isoformat(),
             "history": self.history,
+            "transcript": self.transcript(),
         }
 
         with open(filepath, "w", encoding="utf-8") as f:
@@ -128,9 +664,16 @@ class LLM:
                 "conversation_id", dt.datetime.now().isoformat()
             )
 
-    def check_connection(self, url: str = "http://localhost:11434"):
+    def check_connection(self, url: str = None):
+        """Checks `url`, or every endpoint of the pool when no url is given."""
+        if url is None:
+            pool = get_pool()
+            pool.check_health(force=True)
+            return any(endpoint.healthy for endpoint in pool.endpoints)
         try:
-            response = requests.get(url, timeout=5)  # Short timeout to avoid hanging
+            response = get_http_session().get(
+                url, timeout=5
+            )  # Short timeout to avoid hanging
             return response.status_code == 200
         except requests.ConnectionError:
             return False
@@ -0,0 +1,157 @@
+import re
+import zlib
+import logging
+import numpy as np
+import ollama
+from modules.research.endpoints import ENDPOINT_ERRORS, get_pool
+from modules.research.retrieval import tokenize
+from modules.research.scheduler import get_scheduler
+
+# Loop detection for explorer questions. Every topic a session investigates is
+# kept as a row of a NumPy matrix: an Ollama embedding when `embed_model` is
+# available, else a hashed TF-IDF vector. A proposed question whose cosine
+# similarity to a row reaches the threshold is a rephrasing of ground already
+# covered. Embeddings and TF-IDF vectors score paraphrases differently, so each
+# backend has its own threshold.
+
+
+def hashed_terms(text: str, dim: int) -> np.ndarray:
+    """Counts the words of `text` into `dim` hashed buckets."""
+    counts = np.zeros(dim, dtype=np.float32)
+    for word in tokenize(text):
+        # Crude suffix folding, so "IPO" and "IPOs" land in the same bucket.
+        word = re.sub(r"(?<=\w\w\w)(s|ing|ed)$", "", word)
+        counts[zlib.crc32(word.encode()) % dim] += 1
+    return counts
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class TopicIndex:
+    """
+    The topics one research session has covered, for spotting repeated questions.
+
+    Starts on Ollama embeddings of `embed_model` and falls back to hashed TF-IDF
+    for the rest of the session the first time embedding fails. TF-IDF rows are
+    kept as raw counts and weighted at query time, so the IDF always reflects the
+    topics seen so far.
+    """
+
+    def __init__(
+        self,
+        embed_model: str = None,
+        threshold: float = 0.9,
+        tfidf_threshold: float = 0.6,
+        dim: int = 1024,
+    ):
+        self.embed_model = embed_model or None
+        self.backend = "embeddings" if self.embed_model else "tfidf"
+        self.thresholds = {"embeddings": threshold, "tfidf": tfidf_threshold}
+        self.dim = dim
+        self.topics = []
+        self._matrix = None
+
+    def __len__(self):
+        return len(self.topics)
+
+    @property
+    def threshold(self) -> float:
+        return self.thresholds[self.backend]
+
+    async def _avectors(self, texts: list) -> np.ndarray:
+        if self.backend == "embeddings":
+            try:
+                # Embedding takes a scheduler turn like any chat call, so loading
+                # the model counts against max_resident and shows in its stats.
+                scheduler = get_scheduler()
+                async with scheduler.slot(self.embed_model):
+                    response = await get_pool().acall(
+                        self.embed_model,
+                        lambda client: client.embed(
+                            model=self.embed_model,
+                            input=texts,
+                            keep_alive=scheduler.keep_alive,
+                        ),
+                    )
+                scheduler.record(
+                    self.embed_model, (response.get("load_duration") or 0) / 1e9
+                )
+                # A concurrent call may have fallen back while this one waited.
+                if self.backend == "embeddings":
+                    return _normalize(
+                        np.asarray(response["embeddings"], dtype=np.float32)
+                    )
+            except (ollama.ResponseError, *ENDPOINT_ERRORS) as e:
+                if self.backend == "embeddings":
+                    logging.warning(
+                        f"Embedding with {self.embed_model} failed, using hashed TF-IDF for loop detection: {e}"
+                    )
+                    self.backend = "tfidf"
+                    self._matrix = (
+                        np.stack([hashed_terms(t, self.dim) for t in self.topics])
+                        if self.topics
+                        else None
+                    )
+        return np.stack([hashed_terms(t, self.dim) for t in texts])
+
+    def _similarities(self, vectors: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+        """Cosine similarities between the rows of `vectors` and of `matrix`."""
+        if self.backend == "tfidf":
+            counts = np.vstack([matrix, vectors])
+            df = (counts > 0).sum(axis=0)
+            idf = np.log((1 + len(counts)) / (1 + df)) + 1
+            vectors = _normalize(vectors * idf)
+            matrix = _normalize(matrix * idf)
+        return vectors @ matrix.T
+
+    async def aadd(self, topics: list):
+        """Adds topics the session has investigated or scheduled."""
+        topics = [t for t in dict.fromkeys(topics) if t not in self.topics]
+        if not topics:
+            return
+        vectors = await self._avectors(topics)
+        self.topics.extend(topics)
+        self._matrix = (
+            vectors if self._matrix is None else np.vstack([self._matrix, vectors])
+        )
+
+    async def amatch(self, questions: list, accepted: list = ()) -> list:
+        """
+        Finds the closest covered topic for each question, in order.
+
+        Questions are compared with the covered topics, with `accepted` (matches
+        of earlier calls that were not repeats, reused as they were scored) and
+        with the earlier questions of this list that were not repeats themselves.
+        Returns one {"question", "similar_to", "similarity", "repeat", "vector"}
+        dict per question.
+        """
+        if not questions:
+            return []
+        vectors = await self._avectors(questions)
+        earlier = [m["vector"] for m in accepted]
+        if earlier and len(earlier[0]) != vectors.shape[1]:
+            # Embedding failed in between; score the accepted questions as TF-IDF.
+            earlier = [hashed_terms(m["question"], self.dim) for m in accepted]
+        rows = [self._matrix] if self._matrix is not None else []
+        matrix = np.vstack(rows + earlier + [vectors])
+        similarities = self._similarities(vectors, matrix)
+        known = self.topics + [m["question"] for m in accepted]
+        candidates = list(range(len(known)))
+        matches = []
+        for i, question in enumerate(questions):
+            match = {"question": question, "similar_to": None, "similarity": 0.0}
+            if candidates:
+                row = similarities[i, candidates]
+                best = int(np.argmax(row))
+                match["similar_to"] = known[best]
+                match["similarity"] = round(float(row[best]), 3)
+            match["repeat"] = match["similarity"] >= self.threshold
+            match["vector"] = vectors[i]
+            if not match["repeat"]:
+                known.append(question)
+                candidates.append(len(matrix) - len(questions) + i)
+            matches.append(match)
+        return matches
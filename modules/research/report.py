@@ -0,0 +1,214 @@
+import re
+import time
+import asyncio
+import logging
+from modules.research.context import estimate_tokens, pack_prompt
+
+# The final report is built map-reduce style: every research step is condensed
+# into a bounded digest, digests are merged `merge_fanout` at a time, and only
+# the last, small set of digests goes into the prompt that writes the report.
+# Every call is packed to the context window, and the number of rounds grows
+# with the logarithm of the number of steps. These actions fan out over fresh
+# agents, so unlike actions.py they only come in an async variant.
+
+THINK_BLOCK = re.compile(r"<think>.*?</think>", flags=re.DOTALL)
+
+
+def _clean(reply: str) -> str:
+    """Drops reasoning blocks so they do not take up room in the next round."""
+    return THINK_BLOCK.sub("", reply).strip()
+
+
+def _label(steps: list) -> str:
+    if len(steps) == 1:
+        return f"Iteration {steps[0]}"
+    return f"Iterations {steps[0]} to {steps[-1]}"
+
+
+def _timeout(agent, deadline: float):
+    """The agent's own timeout, shortened to what is left before `deadline`."""
+    if deadline is None:
+        return None
+    remaining = max(1.0, deadline - time.time())
+    return min(agent.model.timeout or remaining, remaining)
+
+
+async def digest_step_async(
+    record: dict,
+    step,
+    origin_topic: str,
+    agent,
+    context_window: int,
+    max_tokens: int = 512,
+    deadline: float = None,
+) -> dict:
+    """Condenses one research record into a digest of about `max_tokens` tokens."""
+    prompt = """Condense this step of a research investigation into a digest of at most {words} words. Keep the concrete findings, figures, named sources and open doubts; drop repetition and filler. Respond with only the digest.
+
+Original topic of inquiry: {origin_topic}
+Topic of this step: {topic}
+
+{sources}"""
+    words = int(max_tokens * 0.6)
+    sections = [
+        {"url": "Analysis", "text": record["analysis"]},
+        {"url": "Criticism", "text": record["criticism"]},
+        {"url": "Synthesized conclusion", "text": record["synthesis"]},
+        {"url": "Next question proposed", "text": record["next_question"]},
+    ]
+    fill = {"words": words, "origin_topic": origin_topic, "topic": record["topic"]}
+    packed = pack_prompt(
+        agent, prompt.format(**fill, sources=""), sections, context_window, max_tokens
+    )
+    reply = await agent.model.aget_response(
+        prompt.format(**fill, sources=packed["text"]),
+        context_window=context_window,
+        max_tokens=max_tokens,
+        task="report_digest",
+        timeout=_timeout(agent, deadline),
+    )
+    text = _clean(reply)
+    if not text or text.startswith("Error:"):
+        # Fall back to the step's own conclusion; the next round trims it if needed.
+        text = record["synthesis"]
+    return {"steps": [step], "text": text}
+
+
+async def merge_digests_async(
+    digests: list,
+    origin_topic: str,
+    agent,
+    context_window: int,
+    max_tokens: int = 512,
+    deadline: float = None,
+) -> dict:
+    """Merges consecutive digests into one digest of about `max_tokens` tokens."""
+    prompt = """Merge these digests of consecutive research steps on "{origin_topic}" into one digest of at most {words} words. Keep the concrete findings, figures and named sources, and note where understanding shifted from one step to the next. Respond with only the merged digest.
+
+{sources}"""
+    words = int(max_tokens * 0.6)
+    sources = [{"url": _label(d["steps"]), "text": d["text"]} for d in digests]
+    packed = pack_prompt(
+        agent,
+        prompt.format(origin_topic=origin_topic, words=words, sources=""),
+        sources,
+        context_window,
+        max_tokens,
+    )
+    reply = await agent.model.aget_response(
+        prompt.format(origin_topic=origin_topic, words=words, sources=packed["text"]),
+        context_window=context_window,
+        max_tokens=max_tokens,
+        task="report_merge",
+        timeout=_timeout(agent, deadline),
+    )
+    text = _clean(reply)
+    if not text or text.startswith("Error:"):
+        text = packed["text"]
+    return {"steps": [s for d in digests for s in d["steps"]], "text": text}
+
+
+async def write_report_async(
+    digests: list,
+    origin_topic: str,
+    agent,
+    context_window: int,
+    max_tokens: int = 2048,
+    deadline: float = None,
+) -> str:
+    """Writes the report narrative from the final digests."""
+    prompt = """You are a lead researcher tasked with creating a final, consolidated report from a research log. The log below is a set of digests of a multi-step investigation that evolved over several iterations, in the order the iterations ran.
+
+### Final Report Task
+
+**Original Topic of Inquiry:**
+{origin_topic}
+
+{sources}
+
+### Final Instructions
+Based on the full research log from all iterations, produce a final, detailed report on the original topic: **"{origin_topic}"**. Your report should not just summarize the final step, but should trace the key findings and shifts in understanding that occurred throughout the investigation. Synthesize all the collected information into a definitive, well-structured conclusion."""
+    sources = [{"url": _label(d["steps"]), "text": d["text"]} for d in digests]
+    packed = pack_prompt(
+        agent,
+        prompt.format(origin_topic=origin_topic, sources=""),
+        sources,
+        context_window,
+        max_tokens,
+    )
+    return await agent.model.aget_response(
+        prompt.format(origin_topic=origin_topic, sources=packed["text"]),
+        context_window=context_window,
+        max_tokens=max_tokens,
+        task="report",
+        timeout=_timeout(agent, deadline),
+    )
+
+
+async def build_report_async(
+    records: list,
+    origin_topic: str,
+    make_agent,
+    agent,
+    context_window: int,
+    config: dict = None,
+    deadline: float = None,
+) -> tuple:
+    """
+    Writes the final report from the research `records` in map-reduce rounds.
+
+    `make_agent()` returns a fresh agent for every digest and merge call, so
+    the calls can run concurrently (up to config["max_workers"]); `agent`
+    writes the narrative. Returns the report and a dict of stage statistics.
+    """
+    config = config or {}
+    digest_tokens = config.get("digest_tokens", 512)
+    fanout = max(2, config.get("merge_fanout", 4))
+    limit = asyncio.Semaphore(config.get("max_workers", 4))
+    report_tokens = config.get("report_tokens", 2048)
+    model_name = agent.model.model_name
+    # Room for digests in the narrative prompt, leaving ~600 tokens of instructions.
+    budget = context_window - report_tokens - 600
+
+    async def run(action, *args):
+        async with limit:
+            return await action(
+                *args, make_agent(), context_window, digest_tokens, deadline
+            )
+
+    start = time.time()
+    digests = await asyncio.gather(
+        *(
+            run(digest_step_async, r, r.get("node_id", i + 1), origin_topic)
+            for i, r in enumerate(records)
+        )
+    )
+    rounds = 0
+    while len(digests) > 1 and (
+        len(digests) > fanout
+        or sum(estimate_tokens(d["text"], model_name) for d in digests) > budget
+    ):
+        groups = [digests[i : i + fanout] for i in range(0, len(digests), fanout)]
+        digests = await asyncio.gather(
+            *(
+                (
+                    run(merge_digests_async, group, origin_topic)
+                    if len(group) > 1
+                    else asyncio.sleep(0, group[0])
+                )
+                for group in groups
+            )
+        )
+        rounds += 1
+    logging.info(
+        f"Report: {len(records)} digests merged in {rounds} rounds into {len(digests)} in {time.time() - start:.1f}s"
+    )
+    report = await write_report_async(
+        digests, origin_topic, agent, context_window, report_tokens, deadline
+    )
+    return report, {
+        "steps": len(records),
+        "merge_rounds": rounds,
+        "final_digests": len(digests),
+        "seconds": round(time.time() - start, 2),
+    }
@@ -1,9 +1,22 @@
+import os
 import re
+import json
 import time
+import asyncio
+import logging
+import sqlite3
+import threading
+import uuid
 from typing import List, Tuple
 import datetime as dt
-from config.config import read_settings
-from modules.research.actions import analyze, critisize, next_step, synthesize
+from config.config import read_settings, read_research_config
+from modules.research.actions import (
+    analyze_async,
+    critisize_async,
+    next_step_async,
+    next_steps_async,
+    synthesize_async,
+)
 from modules.research.agents import (
     AnalystAgent,
     CriticAgent,
@@ -11,16 +24,129 @@ from modules.research.agents import (
     SynthesizerAgent,
 )
 
+from modules.research.endpoints import get_pool
+from modules.research.checkpoint import Checkpoint, load_session, session_path
+from modules.research.cache import SearchCache, get_page_cache, get_response_cache
+from modules.research.llm import LLM, summarize_calls
+from modules.research.novelty import TopicIndex
+from modules.research.report import build_report_async
+from modules.research.retrieval import BM25Index
+from modules.research.scheduler import (
+    apreload_models,
+    get_scheduler,
+    warm_up_models,
+)
+from modules.research.store import get_research_store
 from modules.research.tools import (
-    search_google,
-    fetch_page_content,
+    search_google_async,
+    fetch_multiple_pages_async,
     clean_multiple_texts,
+    close_async_http_client,
+    remove_duplicate_paragraphs,
 )
 
 
+# At most this many covered questions are listed when the explorer is asked again.
+MAX_COVERED_QUESTIONS = 30
+
+# Used for agents without an entry under "history" in research_config.json.
+DEFAULT_HISTORY_POLICIES = {
+    "analyst": "stateless",
+    "critic": "stateless",
+    "synthesizer": "window",
+    "explorer": "compact",
+}
+
+
+async def _closing_loop_clients(coro):
+    """
+    Awaits `coro`, then closes the HTTP clients cached for the running loop.
+
+    The httpx and ollama async clients are kept per event loop; every blocking
+    wrapper runs on a loop of its own, so they are closed before the loop ends
+    instead of leaking a connection pool per run.
+    """
+    try:
+        return await coro
+    finally:
+        await close_async_http_client()
+        await get_pool().aclose()
+
+
+def _log_prefetch_failure(task: asyncio.Task):
+    """Retrieves a failed prefetch's exception, which nobody awaits if it goes unused."""
+    if not task.cancelled() and task.exception() is not None:
+        logging.info(f"Prefetch failed: {task.exception()}")
+
+
+class CancelToken:
+    """
+    Cancellation flag for one research run that any thread may set.
+
+    The run binds its asyncio task to the token; cancel() then cancels that task
+    on its own loop, which aborts in-flight HTTP requests and streamed
+    generations at their next await.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._loop = None
+        self._task = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def bind(self, task: asyncio.Task):
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            self._task = task
+        if self.cancelled:
+            task.cancel()
+
+    def cancel(self):
+        self._event.set()
+        with self._lock:
+            if self._task is not None and not self._loop.is_closed():
+                self._loop.call_soon_threadsafe(self._task.cancel)
+
+
+class ResearchProgress:
+    """
+    Thread-safe progress counter for a research run.
+
+    The total can be revised while the run is going, e.g. when a research tree
+    turns out smaller than planned, and the current step never exceeds it.
+    """
+
+    def __init__(self, total_steps: int):
+        self.current_step = 0
+        self.total_steps = max(1, total_steps)
+        self._lock = threading.Lock()
+
+    def advance(self, steps: int = 1) -> Tuple[int, int]:
+        with self._lock:
+            self.current_step = min(self.current_step + steps, self.total_steps - 1)
+            return self.current_step, self.total_steps
+
+    def state(self) -> Tuple[int, int]:
+        with self._lock:
+            return self.current_step, self.total_steps
+
+    def set_total(self, total_steps: int):
+        with self._lock:
+            self.total_steps = max(total_steps, self.current_step + 1)
+
+    def finish(self):
+        with self._lock:
+            self.current_step = self.total_steps
+
+
 class DeepResearch:
-    def __init__(self, status_callback=None):
+    def __init__(self, status_callback=None, stream_tokens: bool = True):
         self.settings = read_settings()
+        self.research_config = read_research_config()
         self.analyst = AnalystAgent(self.settings["model"]["analyst"]["model_name"])
         self.critic = CriticAgent(self.settings["model"]["critic"]["model_name"])
         self.explorer = ExplorerAgent(self.settings["model"]["explorer"]["model_name"])
@@ -30,8 +156,62 @@ class DeepResearch:
         self.step_str = ""
         self.report = ""
         self.all_research = []
+        self.model_stats = {}
+        self.report_stats = {}
+        self.loop_stats = {}
+        self.run_calls = []
+        self.run_summary = {}
         self.status_callback = status_callback
         self.user_feedback = None
+        self.speculative_config = self.research_config.get("speculative", {})
+        self._prefetched = {}
+        self._prefetch_count = 0
+        self._prefetch_limit = None
+        self._preload_task = None
+        self._progress = None
+        self._checkpoint = None
+        self._resumed_report = None
+        self.checkpoint_path = None
+        self._store_session = None
+        self._topic_index = None
+        self.deadlines = self.research_config.get("deadlines", {})
+        self._cancel_token = CancelToken()
+        self._configure_agents(self._agents)
+        if self.status_callback and stream_tokens:
+            # Stream the main agents' replies to the GUI as they are generated.
+            for agent in self._agents.values():
+                agent.model.token_callback = self._forward_token
+
+    def cancel(self):
+        """Stops the current run as soon as possible; safe to call from any thread."""
+        self._cancel_token.cancel()
+
+    def _run(self, coro):
+        """Runs a research coroutine on a new event loop until it ends or is cancelled."""
+        token = self._cancel_token
+
+        async def main():
+            token.bind(asyncio.current_task())
+            try:
+                await _closing_loop_clients(coro)
+            except asyncio.CancelledError:
+                if not token.cancelled:
+                    raise
+                logging.info("Research run was cancelled")
+
+        try:
+            asyncio.run(main())
+        finally:
+            # A cancelled token stays cancelled; the next run gets a fresh one.
+            if token.cancelled:
+                self._cancel_token = CancelToken()
+
+    def _forward_token(self, delta: str):
+        """Passes a token delta to the status callback, tagged as "token"."""
+        if self._cancel_token.cancelled:
+            return
+        current_step, max_steps = self._progress.state() if self._progress else (0, 0)
+        self.status_callback((delta, current_step, max_steps, "token"))
 
     def set_user_feedback(self, feedback):
         """Stores feedback from the user to influence the next step."""
@@ -40,126 +220,1078 @@ class DeepResearch:
     def set_step_str(self, text: str, current_step: int, max_steps: int):
         """Sets the step string and calls the callback to update the GUI."""
         self.step_str = text
-        if self.status_callback:
+        if self.status_callback and not self._cancel_token.cancelled:
             self.status_callback((text, current_step, max_steps))
 
     def start_research(
         self, topic: str, research_iterations: int = 3, web_iterations: int = 5
     ):
-        self.origin_topic = topic
-        self.current_topic = topic
-        index = 0
-        current_step = 0
+        """Blocking wrapper around start_research_async; returns early on cancel()."""
+        self._run(self.start_research_async(topic, research_iterations, web_iterations))
+
+    async def start_research_async(
+        self,
+        topic: str,
+        research_iterations: int = 3,
+        web_iterations: int = 5,
+        session: dict = None,
+    ):
+        """
+        Researches `topic` in `research_iterations` chained iterations.
+
+        `session` is a checkpointed session from load_session to continue; see
+        resume_async.
+        """
+        self._begin_run(topic)
+        self._start_checkpoint(
+            {
+                "mode": "linear",
+                "topic": topic,
+                "research_iterations": research_iterations,
+                "web_iterations": web_iterations,
+            },
+            session,
+        )
+        await self._start_store_session("linear")
+        first = 0
+        if session:
+            first = self._restore_session(session)
+            self.all_research.extend(session["records"])
+            await self._cover([r["topic"] for r in session["records"]])
+            for name, history in session["agents"].items():
+                self._agents[name].model.history = history
+        await self._warm_models()
         num_operations = 5  # web, analyze, critisize, synthesize, explore
-        max_steps = research_iterations * num_operations
-        for i in range(research_iterations):
-            start = time.time()
-            current_step += 1
-            index_str = index + 1
+        # One extra step for the final report, so the bar only fills when it is done.
+        progress = ResearchProgress(research_iterations * num_operations + 1)
+        self._progress = progress
+        if first:
             self.set_step_str(
-                f"====================\n[{index_str}.0] Topic: {self.current_topic}",
-                current_step,
-                max_steps,
+                f"Resumed after {first} completed iterations",
+                *progress.advance(first * num_operations),
             )
+        for i in range(first, research_iterations):
+            if time.time() > self._run_deadline:
+                self.set_step_str(
+                    f"Run deadline reached after {i} iterations; writing the report",
+                    *progress.state(),
+                )
+                break
+            label = str(i + 1)
             self.set_step_str(
-                f"[{index_str}.1] Searching the web...",
-                current_step,
-                max_steps,
-            )
-            refined_web_prompt = self.refine_query_for_web(self.current_topic)
-            urls = search_google(refined_web_prompt, num_results=web_iterations)
-            content = []
-            for u in urls:
-                c = fetch_page_content(u)
-                content.append(c)
-
-            content = clean_multiple_texts(content)
-            content = "\n".join(content)
-            # Analysis
-            current_step += 1
-            self.set_step_str(
-                f"[{index_str}.2] Analyzing data...", current_step, max_steps
+                f"====================\n[{label}.0] Topic: {self.current_topic}",
+                *progress.advance(),
             )
-            analysis = analyze(
+            marks = self._call_marks(self._agents)
+            gathered = await self._take_prefetched(self.current_topic)
+            if gathered:
+                self.set_step_str(
+                    f"[{label}.1] Using prefetched sources for this question",
+                    *progress.state(),
+                )
+            r = await self._investigate(
                 self.current_topic,
-                content,
-                self.analyst,
-                self.settings["model"]["analyst"]["context_window"],
+                web_iterations,
+                self._agents,
+                progress,
+                label,
+                gathered,
+                done=session["stages"].get(label) if session else None,
             )
-            # Critisize
-            current_step += 1
+            # Explore
             self.set_step_str(
-                f"[{index_str}.3] Critisizing analysis...", current_step, max_steps
+                f"[{label}.5] Generating next question...", *progress.advance()
             )
-            criticism = critisize(
-                analysis,
-                content,
-                self.critic,
-                self.settings["model"]["critic"]["context_window"],
+            start = time.time()
+            if self.speculative_config.get("enabled", False):
+                candidates = await self._explore(
+                    r["synthesis"],
+                    self.explorer,
+                    label,
+                    count=self.speculative_config.get("candidates", 3),
+                )
+                next_question = candidates[0]
+                if i < research_iterations - 1:
+                    for candidate in candidates[1:]:
+                        self._start_prefetch(candidate, web_iterations)
+            else:
+                next_question = (
+                    await self._explore(r["synthesis"], self.explorer, label)
+                )[0]
+            r["next_question"] = next_question
+            r["elapse"] += time.time() - start
+            calls = self._add_llm_usage(r, self._agents, marks)
+            if self.user_feedback:
+                self.set_step_str(
+                    f"Incorporating user feedback: {self.user_feedback}",
+                    *progress.state(),
+                )
+                if self._find_prefetched(self.user_feedback):
+                    # The user picked one of the speculative candidates.
+                    self.current_topic = self.user_feedback
+                else:
+                    self.current_topic = f"{self.user_feedback} - based on this, explore: {next_question}"
+                self.user_feedback = None
+            else:
+                self.current_topic = next_question
+
+            self.all_research.append(r)
+            self._save_checkpoint(
+                {
+                    "type": "record",
+                    "record": r,
+                    "calls": calls,
+                    "current_topic": self.current_topic,
+                    "agents": {
+                        name: agent.model.history
+                        for name, agent in self._agents.items()
+                    },
+                }
             )
-            # Synthesize
-            current_step += 1
+            await self._store_record(label, r)
+
+        self._cancel_prefetches()
+        await self._finish_run(progress)
+
+    def start_research_tree(
+        self,
+        topic: str,
+        depth: int = None,
+        breadth: int = None,
+        web_iterations: int = 5,
+    ):
+        """Blocking wrapper around start_research_tree_async; returns early on cancel()."""
+        self._run(self.start_research_tree_async(topic, depth, breadth, web_iterations))
+
+    async def start_research_tree_async(
+        self,
+        topic: str,
+        depth: int = None,
+        breadth: int = None,
+        web_iterations: int = 5,
+        session: dict = None,
+    ):
+        """
+        Researches `topic` as a tree instead of a single chain.
+
+        Every node is investigated like one iteration of start_research, then the
+        explorer proposes up to `breadth` child questions until `depth` is reached.
+        Nodes run as concurrent tasks limited by tree.max_workers, each with its own
+        agents so concurrent branches never share conversation history. tree.max_nodes
+        and tree.max_seconds bound the total work. Records land in all_research in
+        breadth-first order with their node id, parent and depth. `session` is a
+        checkpointed session to continue; its finished nodes are not run again.
+        """
+        tree_config = self.research_config.get("tree", {})
+        depth = tree_config.get("depth", 2) if depth is None else depth
+        breadth = tree_config.get("breadth", 2) if breadth is None else breadth
+        max_nodes = tree_config.get("max_nodes", 7)
+        self._begin_run(topic)
+        self._start_checkpoint(
+            {
+                "mode": "tree",
+                "topic": topic,
+                "depth": depth,
+                "breadth": breadth,
+                "web_iterations": web_iterations,
+            },
+            session,
+        )
+        await self._start_store_session("tree")
+        restored = {}
+        if session:
+            self._restore_session(session)
+            restored = {r["node_id"]: r for r in session["records"]}
+            await self._cover([r["topic"] for r in session["records"]])
+        deadline = min(
+            self._run_deadline, time.time() + tree_config.get("max_seconds", 1800)
+        )
+        await self._warm_models()
+
+        def subtree_size(levels: int) -> int:
+            return sum(breadth**d for d in range(levels + 1))
+
+        planned_nodes = min(max_nodes, subtree_size(depth))
+        progress = ResearchProgress(planned_nodes * 5 + 1)
+        self._progress = progress
+        scheduled = 1
+        records = []
+        limit = asyncio.Semaphore(tree_config.get("max_workers", 2))
+
+        def node_task(topic: str, node_id: str, parent: str, node_depth: int):
+            if node_id in restored:
+                return asyncio.create_task(
+                    self._restored_tree_node(restored[node_id], progress)
+                )
+            return asyncio.create_task(
+                self._run_tree_node(
+                    limit,
+                    topic,
+                    node_id,
+                    parent,
+                    node_depth,
+                    depth,
+                    breadth,
+                    web_iterations,
+                    progress,
+                    session["stages"].get(node_id) if session else None,
+                )
+            )
+
+        running = {node_task(topic, "1", None, 0)}
+        while running:
+            done, running = await asyncio.wait(
+                running, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                r = task.result()
+                records.append(r)
+                children = r["next_questions"]
+                if time.time() > deadline:
+                    children = []
+                children = children[: max(0, max_nodes - scheduled)]
+                await self._cover(children)
+                for n, child in enumerate(children, start=1):
+                    running.add(
+                        node_task(
+                            child, f"{r['node_id']}.{n}", r["node_id"], r["depth"] + 1
+                        )
+                    )
+                scheduled += len(children)
+                # Drop the steps of subtrees that will never be explored.
+                if r["depth"] < depth:
+                    missing = breadth - len(children)
+                    planned_nodes -= missing * subtree_size(depth - r["depth"] - 1)
+                planned_nodes = max(planned_nodes, scheduled)
+                progress.set_total(planned_nodes * 5 + 1)
+
+        records.sort(key=lambda r: [int(n) for n in r["node_id"].split(".")])
+        records.sort(key=lambda r: r["depth"])
+        self.all_research.extend(records)
+        await self._finish_run(progress)
+
+    async def _run_tree_node(
+        self,
+        limit: asyncio.Semaphore,
+        topic: str,
+        node_id: str,
+        parent: str,
+        node_depth: int,
+        max_depth: int,
+        breadth: int,
+        web_iterations: int,
+        progress,
+        done: dict = None,
+    ) -> dict:
+        async with limit:
+            agents = self._make_agents()
             self.set_step_str(
-                f"[{index_str}.4] Synthesizing responses...", current_step, max_steps
+                f"====================\n[{node_id}] Topic: {topic}", *progress.advance()
             )
-            synthesis = synthesize(
-                analysis,
-                criticism,
-                self.synthesizer,
-                self.settings["model"]["synthesizer"]["context_window"],
+            r = await self._investigate(
+                topic, web_iterations, agents, progress, node_id, done=done
             )
-            # Explore
-            current_step += 1
             self.set_step_str(
-                f"[{index_str}.5] Generating next question...", current_step, max_steps
-            )
-            next_question = next_step(
-                synthesis,
-                self.origin_topic,
-                self.explorer,
-                self.settings["model"]["explorer"]["context_window"],
-            )
-            end = time.time()
-            elapse = end - start
-            r = {
-                "topic": self.current_topic,
-                "web_query": refined_web_prompt,
-                "sources": urls,
-                "analysis": analysis,
-                "criticism": criticism,
-                "synthesis": synthesis,
-                "next_question": next_question,
-                "elapse": elapse,
-            }
-            if self.user_feedback:
-                self.set_step_str(f"Incorporating user feedback: {self.user_feedback}")
-                self.current_topic = (
-                    f"{self.user_feedback} - based on this, explore: {next_question}"
+                f"[{node_id}.5] Generating next questions...", *progress.advance()
+            )
+            children = []
+            if node_depth < max_depth:
+                start = time.time()
+                children = await self._explore(
+                    r["synthesis"],
+                    agents["explorer"],
+                    node_id,
+                    count=breadth,
+                    keep_one=False,
                 )
-                self.user_feedback = None
-            else:
-                self.current_topic = next_question
+                r["elapse"] += time.time() - start
+        calls = self._add_llm_usage(r, agents, {})
+        r.update(
+            {
+                "node_id": node_id,
+                "parent": parent,
+                "depth": node_depth,
+                "next_questions": children,
+                "next_question": children[0] if children else "",
+            }
+        )
+        self._save_checkpoint({"type": "record", "record": r, "calls": calls})
+        await self._store_record(node_id, r)
+        return r
 
-            index += 1
+    async def _restored_tree_node(self, r: dict, progress) -> dict:
+        """Stands in for _run_tree_node with a node finished before a resume."""
+        self.set_step_str(
+            f"[{r['node_id']}] Restored from the checkpoint: {r['topic']}",
+            *progress.advance(5),
+        )
+        return r
 
-            self.all_research.append(r)
+    def _begin_run(self, topic: str):
+        self.origin_topic = topic
+        self.current_topic = topic
+        self.all_research = []
+        self.model_stats = {}
+        self.report_stats = {}
+        self.run_calls = []
+        self.run_summary = {}
+        loops_config = self.research_config.get("loops", {})
+        self._topic_index = None
+        if loops_config.get("enabled", True):
+            self._topic_index = TopicIndex(
+                loops_config.get("embed_model"),
+                threshold=loops_config.get("threshold", 0.9),
+                tfidf_threshold=loops_config.get("tfidf_threshold", 0.6),
+            )
+        self.loop_stats = {
+            "checked": 0,
+            "rejected": [],
+            "reasked": 0,
+            "repeats_kept": 0,
+        }
+        self._run_started = dt.datetime.now()
+        # Tells apart runs of the same topic started in the same second.
+        self._run_id = uuid.uuid4().hex[:8]
+        # deadlines.run_seconds is a soft limit: it is checked before each iteration
+        # or tree node starts, so a run can overrun it by the iteration in flight
+        # (bounded by llm_seconds and web_seconds) plus report_seconds.
+        self._run_deadline = time.time() + self.deadlines.get("run_seconds", 3600)
+        self.report = ""
+        retrieval_config = self.research_config.get("retrieval", {})
+        self.chunk_index = BM25Index(
+            chunk_words=retrieval_config.get("chunk_words", 150)
+        )
+        self._prefetched = {}
+        self._prefetch_count = 0
+        self._prefetch_limit = None
+        self._resumed_report = None
+        self.checkpoint_path = None
+        self._store_session = None
 
-        self.report = self.generate_report(self.origin_topic, self.analyst)
+    async def _warm_models(self):
+        """Starts loading the models of warm_up_models in the background."""
+        scheduler = get_scheduler()
+        resident = await scheduler.refresh_resident(force=True)
+        logging.info(
+            f"Models resident in Ollama: {', '.join(sorted(resident)) or 'none'}"
+        )
+        self._preload_task = asyncio.create_task(
+            apreload_models(warm_up_models(self.settings))
+        )
+
+    async def _finish_run(self, progress):
+        if self._preload_task is not None:
+            self._preload_task.cancel()
+            self._preload_task = None
+        marks = self._call_marks({"analyst": self.analyst})
+        if self._resumed_report is not None:
+            self.report = self._resumed_report
+        else:
+            self.set_step_str("Writing the final report...", *progress.state())
+            self.report = await self.generate_report_async(
+                self.origin_topic, self.analyst
+            )
+            self._save_checkpoint({"type": "finish", "report": self.report})
+        if self._store_session is not None and self.report:
+            store = await asyncio.to_thread(get_research_store)
+            await self._use_store(
+                store.finish_session, self._store_session, self.report
+            )
+        self.run_calls.extend(self.analyst.model.calls[marks["analyst"] :])
+        self.model_stats = get_scheduler().stats()
+        loads = sum(s["loads"] for s in self.model_stats.values())
+        if loads:
+            load_seconds = sum(s["load_seconds"] for s in self.model_stats.values())
+            self.set_step_str(
+                f"Ollama loaded models {loads} times, taking {load_seconds:.1f}s",
+                *progress.state(),
+            )
+        self.run_summary = self._build_run_summary()
+        loops = self.run_summary["loops"]
+        if loops["repeats_avoided"]:
+            self.set_step_str(
+                f"Avoided {loops['repeats_avoided']} repeated questions, asking the explorer {loops['reasked']} more times",
+                *progress.state(),
+            )
+        usage = self.run_summary["llm"]
+        self.set_step_str(
+            f"LLM: {usage['calls']} calls, {usage['prompt_tokens']} prompt + {usage['completion_tokens']} completion tokens, {usage['tokens_per_second'] or 0} tokens/s",
+            *progress.state(),
+        )
+        try:
+            path = self.save_run_summary()
+            logging.info(f"Run summary saved to {path}")
+        except OSError as e:
+            logging.warning(f"Could not save run summary: {e}")
+        progress.finish()
         self.set_step_str(
             f"\nResearch complete for topic: '{self.origin_topic}'!",
-            max_steps,
-            max_steps,
+            *progress.state(),
         )
 
+    def _call_marks(self, agents: dict) -> dict:
+        """Remembers how many calls each agent has made, for _add_llm_usage."""
+        return {name: len(agent.model.calls) for name, agent in agents.items()}
+
+    def _add_llm_usage(self, r: dict, agents: dict, marks: dict) -> list:
+        """Adds up the calls `agents` made since `marks` into the research record `r`; returns them."""
+        calls = []
+        for name, agent in agents.items():
+            calls.extend(agent.model.calls[marks.get(name, 0) :])
+        self.run_calls.extend(calls)
+        r["llm_usage"] = summarize_calls(calls)
+        return calls
+
+    def _build_run_summary(self) -> dict:
+        page_cache = get_page_cache()
+        response_cache = get_response_cache()
+        return {
+            "topic": self.origin_topic,
+            "started": self._run_started.isoformat(),
+            "elapsed_seconds": round(
+                (dt.datetime.now() - self._run_started).total_seconds(), 2
+            ),
+            "iterations": [
+                {
+                    "step": r.get("node_id", i + 1),
+                    "topic": r["topic"],
+                    "elapse": round(r["elapse"], 2),
+                    "llm_usage": r.get("llm_usage", {}),
+                }
+                for i, r in enumerate(self.all_research)
+            ],
+            "llm": summarize_calls(self.run_calls),
+            "models": self.model_stats,
+            "report": self.report_stats,
+            "loops": {
+                "backend": self._topic_index.backend if self._topic_index else None,
+                # Repeated proposals that were not investigated. A re-ask may
+                # have put a new question in their place, so this is not a
+                # count of iterations saved.
+                "repeats_avoided": len(self.loop_stats["rejected"])
+                - self.loop_stats["repeats_kept"],
+                **self.loop_stats,
+            },
+            "page_cache": page_cache.stats() if page_cache else {},
+            "llm_cache": response_cache.stats() if response_cache else {},
+            "calls": sorted(self.run_calls, key=lambda c: c["finished"]),
+        }
+
+    def _session_name(self) -> str:
+        topic = "".join(
+            c for c in self.origin_topic if c.isalnum() or c in (" ", "_")
+        ).strip()[:60]
+        return f"{self._run_started:%Y%m%d-%H%M%S}-{self._run_id} {topic}"
+
+    def resume(self, path: str):
+        """Blocking wrapper around resume_async; returns early on cancel()."""
+        self._run(self.resume_async(path))
+
+    async def resume_async(self, path: str):
+        """
+        Continues the research session checkpointed at `path`.
+
+        Finished iterations or tree nodes, and the finished stages of the one that
+        was interrupted, are restored instead of run again; the agents get back
+        their conversation history and the retrieval index its sources.
+        """
+        session = load_session(path)
+        start = session["start"]
+        if start["mode"] == "tree":
+            await self.start_research_tree_async(
+                start["topic"],
+                start["depth"],
+                start["breadth"],
+                start["web_iterations"],
+                session=session,
+            )
+        else:
+            await self.start_research_async(
+                start["topic"],
+                start["research_iterations"],
+                start["web_iterations"],
+                session=session,
+            )
+
+    def _start_checkpoint(self, start: dict, session: dict = None):
+        """Opens the checkpoint of this run: the resumed `session`'s, or a new one."""
+        self._checkpoint = None
+        if session is not None:
+            self._checkpoint = Checkpoint(session["path"])
+            self._save_checkpoint({"type": "resume"})
+        elif self.research_config.get("checkpoint", {}).get("enabled", True):
+            self._checkpoint = Checkpoint(
+                session_path(
+                    self.research_config["research_output"], self._session_name()
+                )
+            )
+            self._save_checkpoint(
+                {"type": "start", "started": self._run_started.isoformat(), **start}
+            )
+        if self._checkpoint:
+            self.checkpoint_path = self._checkpoint.path
+
+    def _save_checkpoint(self, event: dict):
+        if self._checkpoint is None:
+            return
+        try:
+            self._checkpoint.append(event)
+        except OSError as e:
+            logging.warning(f"Could not write checkpoint {self._checkpoint.path}: {e}")
+
+    def _checkpoint_stage(
+        self, label: str, stage: str, data: dict, agents: dict, agent_name: str
+    ):
+        """Checkpoints a finished stage with the history of the agent that ran it."""
+        self._save_checkpoint(
+            {
+                "type": "stage",
+                "label": label,
+                "stage": stage,
+                "data": data,
+                "agent": agent_name,
+                "history": agents[agent_name].model.history if agent_name else None,
+            }
+        )
+
+    async def _use_store(self, method, *args):
+        """Runs a research store call off the loop; a failing store never stops the run."""
+        try:
+            return await asyncio.to_thread(method, *args)
+        except (sqlite3.Error, OSError) as e:
+            logging.warning(f"Research store error in {method.__name__}: {e}")
+            return None
+
+    async def _start_store_session(self, mode: str):
+        """Opens this run's session in the research store; a resumed run keeps its own."""
+        store = await asyncio.to_thread(get_research_store)
+        if store is not None:
+            self._store_session = await self._use_store(
+                store.start_session, self.origin_topic, mode, self.checkpoint_path
+            )
+
+    async def _store_record(self, label: str, r: dict):
+        if self._store_session is not None:
+            store = await asyncio.to_thread(get_research_store)
+            await self._use_store(store.add_iteration, self._store_session, label, r)
+
+    async def _recall(self, topic: str) -> dict:
+        """
+        Looks up earlier findings and sources on `topic` in the research store.
+
+        Returns {"findings", "sources"}, both lists of {"url", "text"} content;
+        findings and sources from this run's own session are left out.
+        """
+        store = await asyncio.to_thread(get_research_store)
+        store_config = self.research_config.get("store", {})
+        recalled = {"findings": [], "sources": []}
+        if store is None:
+            return recalled
+        findings = await self._use_store(
+            store.search_findings,
+            topic,
+            store_config.get("prior_findings", 3),
+            self._store_session,
+        )
+        sources = await self._use_store(
+            store.search_sources,
+            topic,
+            store_config.get("prior_sources", 3),
+            self._store_session,
+        )
+        recalled["findings"] = [
+            {
+                "url": f"Earlier research ({f['started'][:10]}): {f['topic']}",
+                "text": f["synthesis"],
+            }
+            for f in findings or []
+            if f["synthesis"]
+        ]
+        recalled["sources"] = [
+            {"url": s["url"], "text": s["text"]} for s in sources or []
+        ]
+        return recalled
+
+    def _restore_session(self, session: dict) -> int:
+        """Loads what a checkpointed session already produced; returns its record count."""
+        self.current_topic = session["current_topic"]
+        self.run_calls.extend(session["calls"])
+        if self.research_config.get("retrieval", {}).get("enabled", True):
+            for source in session["sources"]:
+                self.chunk_index.add(source["text"], source["url"])
+        self._resumed_report = session["report"]
+        logging.info(
+            f"Resuming {session['path']}: {len(session['records'])} records, {len(session['stages'])} unfinished"
+        )
+        return len(session["records"])
+
+    def save_run_summary(self, path: str = None) -> str:
+        """
+        Writes the summary of the last run as JSON and returns its path.
+
+        Defaults to a timestamped file under <research_output>/runs.
+        """
+        if path is None:
+            path = os.path.join(
+                self.research_config["research_output"],
+                "runs",
+                f"{self._session_name()}.json",
+            )
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.run_summary, f, indent=2, ensure_ascii=False)
+        return path
+
+    def _configure_agents(self, agents: dict):
+        """
+        Applies the per-agent settings from research_config.json.
+
+        The analyst and critic get fresh, packed sources with every prompt, so by
+        default they send no earlier turns; the synthesizer keeps a short window and
+        the explorer a compacted memory of the questions it already asked.
+        """
+        cache_flags = self.research_config.get("llm_cache", {}).get("agents", {})
+        history_config = self.research_config.get("history", {})
+        for name, agent in agents.items():
+            agent.model.use_cache = cache_flags.get(name, False)
+            agent.model.timeout = self.deadlines.get("llm_seconds")
+            policy = history_config.get(name, {})
+            agent.model.set_history_policy(
+                policy.get("policy", DEFAULT_HISTORY_POLICIES[name]),
+                policy.get("budget", 2048),
+            )
+
+    def _make_agents(self) -> dict:
+        """Creates a fresh set of research agents with the configured models."""
+        agents = {
+            "analyst": AnalystAgent(self.settings["model"]["analyst"]["model_name"]),
+            "critic": CriticAgent(self.settings["model"]["critic"]["model_name"]),
+            "explorer": ExplorerAgent(self.settings["model"]["explorer"]["model_name"]),
+            "synthesizer": SynthesizerAgent(
+                self.settings["model"]["synthesizer"]["model_name"]
+            ),
+        }
+        self._configure_agents(agents)
+        return agents
+
+    @property
+    def _agents(self) -> dict:
+        return {
+            "analyst": self.analyst,
+            "critic": self.critic,
+            "explorer": self.explorer,
+            "synthesizer": self.synthesizer,
+        }
+
+    async def _investigate(
+        self,
+        topic: str,
+        web_iterations: int,
+        agents: dict,
+        progress,
+        label: str,
+        gathered: dict = None,
+        done: dict = None,
+    ) -> dict:
+        """
+        Runs the web, analysis, critique and synthesis stages for one question.
+
+        Returns the research record for `topic`; the explorer stage is left to the
+        caller. `gathered` holds sources that were already fetched, if any, and
+        `done` the stages of `label` restored from a checkpoint, which are not run
+        again. Every stage that does run is checkpointed when it finishes.
+        """
+        start = time.time()
+        done = done or {}
+        for stage in done.values():
+            if stage.get("agent"):
+                agents[stage["agent"]].model.history = stage["history"]
+        retrieval_config = self.research_config.get("retrieval", {})
+        await self._cover([topic])
+        if "sources" in done:
+            sources = done["sources"]["data"]
+            self.set_step_str(
+                f"[{label}.1] Restored {len(sources['content'])} sources from the checkpoint",
+                *progress.state(),
+            )
+        else:
+            # Prefetched sources were refined by a private LLM, not the explorer.
+            refiner = None if gathered else "explorer"
+            sources = await self._collect_sources(
+                topic, web_iterations, agents, progress, label, gathered
+            )
+            self._checkpoint_stage(label, "sources", sources, agents, refiner)
+        content = sources["content"]
+        retrieved = []
+        if retrieval_config.get("enabled", True):
+            retrieved = self.chunk_index.search(
+                topic, top_k=retrieval_config.get("top_k", 12)
+            )
+            if retrieved:
+                content = retrieved
+        # Analysis
+        self.set_step_str(f"[{label}.2] Analyzing data...", *progress.advance())
+        if "analysis" in done:
+            analysis = done["analysis"]["data"]
+        else:
+            text, packed = await analyze_async(
+                topic,
+                content,
+                agents["analyst"],
+                self.settings["model"]["analyst"]["context_window"],
+            )
+            analysis = {
+                "text": text,
+                "context": {k: packed[k] for k in ("tokens", "included", "dropped")},
+            }
+            self._checkpoint_stage(label, "analysis", analysis, agents, "analyst")
+        # Critisize
+        self.set_step_str(f"[{label}.3] Critisizing analysis...", *progress.advance())
+        if "criticism" in done:
+            criticism = done["criticism"]["data"]
+        else:
+            text, packed = await critisize_async(
+                analysis["text"],
+                content,
+                agents["critic"],
+                self.settings["model"]["critic"]["context_window"],
+            )
+            criticism = {
+                "text": text,
+                "context": {k: packed[k] for k in ("tokens", "included", "dropped")},
+            }
+            self._checkpoint_stage(label, "criticism", criticism, agents, "critic")
+        # Synthesize
+        self.set_step_str(f"[{label}.4] Synthesizing responses...", *progress.advance())
+        if "synthesis" in done:
+            synthesis = done["synthesis"]["data"]
+        else:
+            synthesis = {
+                "text": await synthesize_async(
+                    analysis["text"],
+                    criticism["text"],
+                    agents["synthesizer"],
+                    self.settings["model"]["synthesizer"]["context_window"],
+                )
+            }
+            self._checkpoint_stage(label, "synthesis", synthesis, agents, "synthesizer")
+        response_cache = get_response_cache()
+        return {
+            "topic": topic,
+            "web_query": sources["web_query"],
+            "sources": sources["urls"],
+            "fetch_times": sources["fetch_times"],
+            "page_cache": sources["page_cache"],
+            "llm_cache": response_cache.stats() if response_cache else {},
+            "dedup": sources["dedup"],
+            "recalled": sources.get("recalled", {}),
+            "retrieved_chunks": [
+                {"url": c["url"], "score": round(c["score"], 3)} for c in retrieved
+            ],
+            "context": {
+                "analysis": analysis["context"],
+                "criticism": criticism["context"],
+            },
+            "analysis": analysis["text"],
+            "criticism": criticism["text"],
+            "synthesis": synthesis["text"],
+            "ttft": {
+                name: agents[name].model.last_ttft
+                for name in ("analyst", "critic", "synthesizer")
+            },
+            "load_seconds": {
+                name: round(agents[name].model.last_load_duration, 2)
+                for name in ("analyst", "critic", "synthesizer")
+            },
+            "elapse": time.time() - start,
+        }
+
+    async def _cover(self, topics: list):
+        """Adds topics the session has investigated or scheduled to the loop detector."""
+        if self._topic_index is not None and topics:
+            await self._topic_index.aadd(topics)
+
+    async def _explore(
+        self,
+        synthesis: str,
+        agent,
+        label: str,
+        count: int = None,
+        keep_one: bool = True,
+    ) -> list:
+        """
+        Asks `agent` for the next question, or up to `count` of them, best first.
+
+        Questions that rephrase a topic the session already covered are rejected,
+        and the explorer is asked again with the covered ground listed, up to
+        loops.max_retries times. With `keep_one`, the least similar rejected
+        question stands in when nothing new comes up, so a linear run goes on.
+        """
+        context_window = self.settings["model"]["explorer"]["context_window"]
+        retries = self.research_config.get("loops", {}).get("max_retries", 2)
+        questions = []
+        accepted = []
+        rejected = []
+        covered = None
+        for attempt in range(1 + retries if self._topic_index else 1):
+            if attempt:
+                self.loop_stats["reasked"] += 1
+                covered = list(
+                    dict.fromkeys(
+                        self._topic_index.topics
+                        + questions
+                        + [m["question"] for m in rejected]
+                    )
+                )[-MAX_COVERED_QUESTIONS:]
+            if count is None:
+                asked = [
+                    await next_step_async(
+                        synthesis,
+                        self.origin_topic,
+                        agent,
+                        context_window,
+                        covered=covered,
+                    )
+                ]
+            else:
+                asked = await next_steps_async(
+                    synthesis,
+                    self.origin_topic,
+                    agent,
+                    context_window,
+                    count=count - len(questions),
+                    covered=covered,
+                )
+            if self._topic_index is None:
+                return asked
+            # Accepted questions keep their scores; only the new ones are scored.
+            for match in await self._topic_index.amatch(asked, accepted):
+                self.loop_stats["checked"] += 1
+                if not match["repeat"]:
+                    accepted.append(match)
+                    questions.append(match["question"])
+                    continue
+                if any(m["question"] == match["question"] for m in rejected):
+                    continue
+                rejected.append(match)
+                self.loop_stats["rejected"].append(
+                    {
+                        "step": label,
+                        "question": match["question"],
+                        "similar_to": match["similar_to"],
+                        "similarity": match["similarity"],
+                    }
+                )
+                self.set_step_str(
+                    f"[{label}.5] Skipping a repeated question ({match['similarity']:.2f} similar to \"{match['similar_to']}\"): {match['question']}",
+                    *self._progress.state(),
+                )
+            if len(questions) >= (count or 1):
+                break
+        if not questions and keep_one and rejected:
+            self.loop_stats["repeats_kept"] += 1
+            questions = [min(rejected, key=lambda m: m["similarity"])["question"]]
+        return questions[: count or 1]
+
+    async def _collect_sources(
+        self,
+        topic: str,
+        web_iterations: int,
+        agents: dict,
+        progress,
+        label: str,
+        gathered: dict = None,
+    ) -> dict:
+        """
+        Gathers, deduplicates and cleans the sources for `topic`.
+
+        Earlier findings and sources from the research store come first, and can
+        stand in for the web search when store.skip_web_min_sources of them are
+        found. The cleaned sources are added to the retrieval index and returned
+        with the query, urls and fetch statistics they came from; the ones fetched
+        from the web are also saved to the store.
+        """
+        recalled = await self._recall(topic)
+        if recalled["findings"] or recalled["sources"]:
+            self.set_step_str(
+                f"[{label}.1] Found {len(recalled['findings'])} earlier findings and {len(recalled['sources'])} sources in the research store",
+                *progress.state(),
+            )
+        skip_web = self.research_config.get("store", {}).get("skip_web_min_sources", 0)
+        if not gathered and skip_web and len(recalled["sources"]) >= skip_web:
+            self.set_step_str(
+                f"[{label}.1] Skipping the web search, the research store covers it",
+                *progress.state(),
+            )
+            gathered = {"web_query": "", "urls": [], "pages": [], "fetch_elapse": 0.0}
+        else:
+            self.set_step_str(f"[{label}.1] Searching the web...", *progress.state())
+        if not gathered:
+            gathered = await self._gather_sources(
+                topic, web_iterations, llm=agents["explorer"].model
+            )
+        pages = gathered["pages"]
+        fetch_times = {p["url"]: round(p["elapse"], 2) for p in pages}
+        for u, t in fetch_times.items():
+            logging.info(f"Fetched {u} in {t:.2f}s")
+        page_cache = get_page_cache()
+        cache_stats = page_cache.stats() if page_cache else {}
+        if pages:
+            slowest = max(pages, key=lambda p: p["elapse"])
+            cache_str = (
+                f", cache hits: {cache_stats['hits'] + cache_stats['revalidated']} misses: {cache_stats['misses']}"
+                if cache_stats
+                else ""
+            )
+            self.set_step_str(
+                f"[{label}.1] Fetched {len(pages)} pages in {gathered['fetch_elapse']:.2f}s (slowest: {slowest['url']} {slowest['elapse']:.2f}s{cache_str})",
+                *progress.state(),
+            )
+
+        # MinHash over every paragraph is CPU work; keep it off the event loop.
+        texts, dedup_stats = await asyncio.to_thread(
+            remove_duplicate_paragraphs, [p["content"] for p in pages]
+        )
+        if dedup_stats["removed"]:
+            self.set_step_str(
+                f"[{label}.1] Removed {dedup_stats['removed']} duplicate paragraphs ({dedup_stats['chars_saved']} chars, ~{dedup_stats['tokens_saved']} tokens)",
+                *progress.state(),
+            )
+        content = [
+            {"url": p["url"], "text": text}
+            for p, text in zip(pages, clean_multiple_texts(texts))
+            if text
+        ]
+        store = await asyncio.to_thread(get_research_store)
+        if store is not None and content:
+            await self._use_store(store.add_sources, content)
+        # A page fetched again just now replaces its stored copy.
+        fetched = {source["url"] for source in content}
+        content = (
+            recalled["findings"]
+            + [s for s in recalled["sources"] if s["url"] not in fetched]
+            + content
+        )
+        if self.research_config.get("retrieval", {}).get("enabled", True):
+            for source in content:
+                self.chunk_index.add(source["text"], source["url"])
+        return {
+            "web_query": gathered["web_query"],
+            "urls": gathered["urls"],
+            "fetch_times": fetch_times,
+            "page_cache": cache_stats,
+            "dedup": dedup_stats,
+            "recalled": {k: [s["url"] for s in v] for k, v in recalled.items()},
+            "content": content,
+        }
+
     def get_report(self):
         return self.report
 
-    def refine_query_for_web(self, query: str):
-        prompt = f"Take this user's query and refine it to be a web search. Here is the current date if relevant: {dt.datetime.now().date()}\nHere is the user's query: {query}. Return nothing but the refined query. Stick close to the original query. Do not add extra questions."
-        return self.explorer.model.get_response(prompt)
+    async def _gather_sources(self, topic: str, web_iterations: int, llm=None) -> dict:
+        """
+        Refines `topic` into a web query, searches and fetches the result pages.
 
-    def generate_report(self, origin_topic, agent):
+        `llm` overrides the explorer model used for the refinement.
+        """
+        web_query = await self.refine_query_for_web_async(topic, llm=llm)
+        urls = await search_google_async(web_query, num_results=web_iterations)
+        fetch_config = self.research_config["fetch"]
+        fetch_start = time.time()
+        pages = await fetch_multiple_pages_async(
+            urls,
+            max_workers=fetch_config["max_workers"],
+            per_host_limit=fetch_config["per_host_limit"],
+            page_timeout=self.deadlines.get("page_seconds"),
+            deadline=self.deadlines.get("web_seconds"),
+        )
+        return {
+            "web_query": web_query,
+            "urls": urls,
+            "pages": pages,
+            "fetch_elapse": time.time() - fetch_start,
+        }
+
+    def _start_prefetch(self, question: str, web_iterations: int):
+        """Gathers sources for a runner-up question in the background, within budget."""
+        if self._prefetch_count >= self.speculative_config.get("max_prefetch", 4):
+            return
+        if self._find_prefetched(question):
+            return
+        if self._prefetch_limit is None:
+            self._prefetch_limit = asyncio.Semaphore(
+                self.speculative_config.get("max_workers", 2)
+            )
+        task = asyncio.create_task(self._prefetch(question, web_iterations))
+        task.add_done_callback(_log_prefetch_failure)
+        self._prefetched[question] = task
+        self._prefetch_count += 1
+        logging.info(f"Prefetching sources for candidate question: {question}")
+
+    async def _prefetch(self, question: str, web_iterations: int) -> dict:
+        async with self._prefetch_limit:
+            # A private LLM keeps background refinements out of the explorer's history.
+            llm = LLM(
+                self.explorer.model.model_name,
+                self.explorer.model.system_prompt,
+                history_policy="stateless",
+            )
+            llm.use_cache = self.explorer.model.use_cache
+            llm.agent_name = "Explorer (prefetch)"
+            llm.timeout = self.explorer.model.timeout
+            try:
+                return await self._gather_sources(question, web_iterations, llm)
+            finally:
+                self.run_calls.extend(llm.calls)
+
+    def _find_prefetched(self, question: str) -> str:
+        """Returns the prefetched question that `question` matches, or None."""
+        terms = set(SearchCache.normalize_query(question).split())
+        for candidate in self._prefetched:
+            candidate_terms = set(SearchCache.normalize_query(candidate).split())
+            union = terms | candidate_terms
+            if union and len(terms & candidate_terms) / len(union) >= 0.8:
+                return candidate
+        return None
+
+    async def _take_prefetched(self, question: str) -> dict:
+        """
+        Returns the gathered sources for `question` if it was prefetched.
+
+        The iteration has settled on `question`, so the prefetches of the other
+        candidates will not be used and are cancelled.
+        """
+        candidate = self._find_prefetched(question)
+        task = self._prefetched.pop(candidate) if candidate is not None else None
+        self._cancel_prefetches()
+        if task is None:
+            return None
+        try:
+            return await task
+        except Exception as e:
+            logging.warning(f"Prefetch for '{candidate}' failed: {e}")
+            return None
 
+    def _cancel_prefetches(self):
+        """Cancels speculative work that was never used."""
+        for question, task in self._prefetched.items():
+            if not task.done():
+                task.cancel()
+                logging.info(f"Cancelled unused prefetch: {question}")
+        self._prefetched = {}
+
+    def _refine_prompt(self, query: str) -> str:
+        return f"Take this user's query and refine it to be a web search. Here is the current date if relevant: {dt.datetime.now().date()}\nHere is the user's query: {query}. Return nothing but the refined query. Stick close to the original query. Do not add extra questions."
+
+    def refine_query_for_web(self, query: str, llm=None):
+        llm = llm or self.explorer.model
+        return llm.get_response(self._refine_prompt(query), task="refine_query")
+
+    async def refine_query_for_web_async(self, query: str, llm=None):
+        llm = llm or self.explorer.model
+        return await llm.aget_response(self._refine_prompt(query), task="refine_query")
+
+    def _report_prompt(self, origin_topic) -> str:
         prompt = f"""You are a lead researcher tasked with creating a final, consolidated report from a research log. The log details a multi-step investigation that evolved over several iterations. Your report should synthesize the findings from the *entire* process into a single, comprehensive narrative.
 
 ### Final Report Task
@@ -167,7 +1299,10 @@ class DeepResearch:
 **Original Topic of Inquiry:**
 {origin_topic}"""
         for i in range(len(self.all_research)):
-            new_prompt = f"""**Iteration {i+1}:**
+            step = self.all_research[i].get("node_id", i + 1)
+            if self.all_research[i].get("parent"):
+                step = f"{step} (follows up on {self.all_research[i]['parent']})"
+            new_prompt = f"""**Iteration {step}:**
 * **Topic Focus:** {self.all_research[i]['topic']}
 * **Analysis:** {self.all_research[i]['analysis']}
 * **Criticism:** {self.all_research[i]['criticism']}
@@ -178,8 +1313,56 @@ class DeepResearch:
         final_insturctions = """### Final Instructions
     Based on the full research log from all iterations, produce a final, detailed report on the original topic: **"{origin_topic}"**. Your report should not just summarize the final step, but should trace the key findings and shifts in understanding that occurred throughout the investigation. Synthesize all the collected information into a definitive, well-structured conclusion."""
         prompt += final_insturctions
+        return prompt
+
+    def generate_report(self, origin_topic, agent):
+        """Blocking wrapper around generate_report_async."""
+        return asyncio.run(
+            _closing_loop_clients(self.generate_report_async(origin_topic, agent))
+        )
 
-        report = agent.model.get_response(prompt)
+    async def generate_report_async(self, origin_topic, agent):
+        """
+        Writes the final report on `origin_topic` from all_research.
+
+        With report.map_reduce on, every iteration is condensed into a digest in
+        parallel and the digests are merged in rounds before `agent` writes the
+        narrative (see report.py). Otherwise the whole log goes into one prompt.
+        """
+        report_config = self.research_config.get("report", {})
+        context_window = self.settings["model"]["analyst"]["context_window"]
+        timeout = self.deadlines.get("report_seconds")
+        if not report_config.get("map_reduce", True):
+            return await agent.model.aget_response(
+                self._report_prompt(origin_topic),
+                context_window=context_window,
+                task="report",
+                timeout=timeout,
+            )
+        helpers = []
+
+        def make_agent():
+            # One stateless analyst per call, so the calls can run side by side.
+            helper = AnalystAgent(agent.model.model_name)
+            self._configure_agents({"analyst": helper})
+            helper.model.set_history_policy("stateless")
+            helper.model.agent_name = "Analyst (report)"
+            helpers.append(helper)
+            return helper
+
+        try:
+            report, self.report_stats = await build_report_async(
+                self.all_research,
+                origin_topic,
+                make_agent,
+                agent,
+                context_window,
+                report_config,
+                deadline=time.time() + timeout if timeout else None,
+            )
+        finally:
+            for helper in helpers:
+                self.run_calls.extend(helper.model.calls)
         return report
 
     def split_response_and_thinking(
@@ -0,0 +1,115 @@
+import re
+import numpy as np
+
+STOPWORDS = set(
+    """a an and are as at be but by for from has have he her his i if in into is it
+    its me my no not of on or our she so than that the their them then there these
+    they this to was we were what when where which who why will with you your""".split()
+)
+
+
+def tokenize(text: str) -> list:
+    return [t for t in re.findall(r"\w+", text.lower()) if t not in STOPWORDS]
+
+
+def chunk_text(text: str, chunk_words: int = 150) -> list:
+    """Splits `text` into chunks of roughly `chunk_words` words along sentence ends."""
+    chunks = []
+    current = []
+    count = 0
+    for sentence in re.split(r"(?<=[.!?])\s+", text):
+        words = len(sentence.split())
+        if current and count + words > chunk_words:
+            chunks.append(" ".join(current))
+            current = []
+            count = 0
+        current.append(sentence)
+        count += words
+    if current:
+        chunks.append(" ".join(current))
+    return [c for c in chunks if c.strip()]
+
+
+class BM25Index:
+    """
+    In-memory BM25 index over page chunks for one research session.
+
+    Each chunk keeps the url it came from. Postings are stored per term as chunk
+    ids and term frequencies and turned into NumPy arrays when searched, so
+    scoring a query is a handful of vectorized updates over a score array.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, chunk_words: int = 150):
+        self.k1 = k1
+        self.b = b
+        self.chunk_words = chunk_words
+        self.chunks = []
+        self.lengths = []
+        self.postings = {}
+        self._seen = set()
+        self._arrays = {}
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def add(self, text: str, url: str) -> int:
+        """Chunks and indexes `text`; returns the number of new chunks."""
+        added = 0
+        for chunk in chunk_text(text, self.chunk_words):
+            if chunk in self._seen:
+                continue
+            self._seen.add(chunk)
+            terms = tokenize(chunk)
+            if not terms:
+                continue
+            chunk_id = len(self.chunks)
+            self.chunks.append({"url": url, "text": chunk})
+            self.lengths.append(len(terms))
+            frequencies = {}
+            for term in terms:
+                frequencies[term] = frequencies.get(term, 0) + 1
+            for term, tf in frequencies.items():
+                self.postings.setdefault(term, ([], []))
+                self.postings[term][0].append(chunk_id)
+                self.postings[term][1].append(tf)
+            added += 1
+        if added:
+            self._arrays = {}
+        return added
+
+    def _posting_arrays(self, term: str):
+        if term not in self._arrays:
+            ids, tfs = self.postings[term]
+            self._arrays[term] = (
+                np.asarray(ids, dtype=np.int64),
+                np.asarray(tfs, dtype=np.float64),
+            )
+        return self._arrays[term]
+
+    def search(self, query: str, top_k: int = 12) -> list:
+        """Returns the `top_k` best matching chunks as {"url", "text", "score"} dicts."""
+        if not self.chunks:
+            return []
+        lengths = np.asarray(self.lengths, dtype=np.float64)
+        norm = self.k1 * (1 - self.b + self.b * lengths / lengths.mean())
+        scores = np.zeros(len(self.chunks))
+        n = len(self.chunks)
+        for term in set(tokenize(query)):
+            if term not in self.postings:
+                continue
+            ids, tfs = self._posting_arrays(term)
+            idf = np.log(1 + (n - len(ids) + 0.5) / (len(ids) + 0.5))
+            scores[ids] += idf * tfs * (self.k1 + 1) / (tfs + norm[ids])
+        top_k = min(top_k, int((scores > 0).sum()))
+        if top_k == 0:
+            return []
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+        return [
+            {
+                "url": self.chunks[i]["url"],
+                "text": self.chunks[i]["text"],
+                "score": float(scores[i]),
+            }
+            for i in best
+        ]
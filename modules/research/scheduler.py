@@ -0,0 +1,258 @@
+import time
+import asyncio
+import logging
+import weakref
+import contextlib
+from functools import lru_cache
+from config.config import read_research_config
+from modules.research.endpoints import get_pool
+
+# Load times below this are Ollama touching a model that was already in memory.
+LOAD_THRESHOLD_SECONDS = 0.25
+
+
+@lru_cache(maxsize=1)
+def get_scheduler_config() -> dict:
+    return read_research_config().get("scheduler", {})
+
+
+def get_max_resident() -> int:
+    """Returns how many models may serve calls at once across the pool; 0 means no limit."""
+    return get_scheduler_config().get("max_resident", 1) * len(get_pool().endpoints)
+
+
+def get_keep_alive():
+    """Returns the keep_alive sent with every research call, e.g. "30m"."""
+    return get_scheduler_config().get("keep_alive", "30m")
+
+
+class ModelScheduler:
+    """
+    Orders concurrent LLM calls so that Ollama swaps model weights as rarely as possible.
+
+    At most `max_resident` models serve calls at the same time (0 lifts the limit);
+    get_scheduler allows that many per Ollama endpoint in the pool.
+    A call for a model that is already serving starts right away as long as no
+    other model is waiting; otherwise it queues. Waiting models are served in
+    the order their first call arrived, each with all of its pending calls, so
+    calls stay grouped by model without one busy model starving the others.
+    """
+
+    def __init__(
+        self,
+        keep_alive="30m",
+        max_resident: int = 1,
+        ps_refresh_seconds: float = 5,
+    ):
+        self.keep_alive = keep_alive
+        self.max_resident = max_resident
+        self.ps_refresh_seconds = ps_refresh_seconds
+        self.resident = set()
+        self._resident_at = 0.0
+        self._active = {}
+        self._waiting = {}
+        self._stats = {}
+
+    async def refresh_resident(self, force: bool = False) -> set:
+        """Asks every healthy endpoint which models are loaded; reused for a few seconds."""
+        if not force and time.time() - self._resident_at < self.ps_refresh_seconds:
+            return self.resident
+        resident = set()
+        for endpoint in get_pool().endpoints:
+            if not endpoint.healthy:
+                continue
+            try:
+                response = await endpoint.async_client().ps()
+                endpoint.resident = {m.model for m in response.models}
+            except Exception as e:
+                logging.warning(
+                    f"Could not list resident models on {endpoint.host}: {e}"
+                )
+            resident |= endpoint.resident
+        self.resident = resident
+        self._resident_at = time.time()
+        return self.resident
+
+    @contextlib.asynccontextmanager
+    async def slot(self, model_name: str):
+        """Holds a turn for one call to `model_name`."""
+        await self._acquire(model_name)
+        try:
+            yield
+        finally:
+            self._release(model_name)
+
+    async def _acquire(self, model_name: str):
+        if self.max_resident <= 0 or (
+            not self._waiting
+            and (model_name in self._active or len(self._active) < self.max_resident)
+        ):
+            self._active[model_name] = self._active.get(model_name, 0) + 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(model_name, []).append(future)
+        logging.info(
+            f"Call to {model_name} waits for {', '.join(self._active)} to finish"
+        )
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.cancelled():
+                waiting = self._waiting.get(model_name, [])
+                if future in waiting:
+                    waiting.remove(future)
+                if not waiting:
+                    self._waiting.pop(model_name, None)
+                    # Calls queued behind this model may be able to start now.
+                    self._grant()
+            else:
+                # The turn was granted just as the call was cancelled.
+                self._release(model_name)
+            raise
+
+    def _release(self, model_name: str):
+        self._active[model_name] -= 1
+        if self._active[model_name] == 0:
+            del self._active[model_name]
+            self._grant()
+
+    def _grant(self):
+        # _waiting keeps the order in which each model's first waiting call arrived.
+        while self._waiting:
+            model_name = next(iter(self._waiting))
+            if (
+                model_name not in self._active
+                and len(self._active) >= self.max_resident
+            ):
+                break
+            for future in self._waiting.pop(model_name):
+                if future.done():
+                    continue
+                self._active[model_name] = self._active.get(model_name, 0) + 1
+                future.set_result(None)
+
+    def record(self, model_name: str, load_seconds: float):
+        """Counts one finished call and the time Ollama spent loading the model for it."""
+        stats = self._stats.setdefault(
+            model_name, {"calls": 0, "loads": 0, "load_seconds": 0.0}
+        )
+        stats["calls"] += 1
+        stats["load_seconds"] += load_seconds
+        if load_seconds >= LOAD_THRESHOLD_SECONDS:
+            stats["loads"] += 1
+            logging.info(f"{model_name}: loaded in {load_seconds:.2f}s")
+            self.resident.add(model_name)
+
+    def stats(self) -> dict:
+        return {
+            model_name: {**stats, "load_seconds": round(stats["load_seconds"], 2)}
+            for model_name, stats in self._stats.items()
+        }
+
+
+_schedulers = weakref.WeakKeyDictionary()
+
+
+def get_scheduler() -> ModelScheduler:
+    """
+    Returns the ModelScheduler of the running event loop.
+
+    Every research run has its own loop, so the scheduler's statistics cover
+    exactly one run.
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _schedulers:
+        config = get_scheduler_config()
+        _schedulers[loop] = ModelScheduler(
+            keep_alive=config.get("keep_alive", "30m"),
+            max_resident=get_max_resident(),
+            ps_refresh_seconds=config.get("ps_refresh_seconds", 5),
+        )
+    return _schedulers[loop]
+
+
+def configured_models(settings: dict, roles: list = None) -> list:
+    """
+    Returns the distinct model names of `roles` in settings.json, in configured order.
+
+    The embedding model of loop detection (research_config.json "loops") comes
+    last when it is enabled, as it is the smallest and least urgent to load.
+    """
+    models = settings["model"]
+    names = []
+    for role in roles or list(models):
+        name = models.get(role, {}).get("model_name")
+        if name and name not in names:
+            names.append(name)
+    loops_config = read_research_config().get("loops", {})
+    embed_model = loops_config.get("embed_model")
+    if loops_config.get("enabled", True) and embed_model and embed_model not in names:
+        names.append(embed_model)
+    return names
+
+
+def warm_up_models(settings: dict) -> list:
+    """
+    Returns the models to load ahead of a run, in the order the research steps use them.
+
+    Only as many as the scheduler lets be resident are returned, so warming up
+    never evicts the model the first step needs.
+    """
+    models = configured_models(
+        settings, ["explorer", "analyst", "critic", "synthesizer"]
+    )
+    max_resident = get_max_resident()
+    return models[:max_resident] if max_resident > 0 else models
+
+
+def preload_models(model_names: list, progress_callback=None):
+    """
+    Loads `model_names` one after another with empty generate requests.
+
+    Blocking, so run it on a background thread. Models Ollama already has
+    resident are skipped. `progress_callback` receives (text, done, total).
+    """
+    pool = get_pool()
+    pool.check_health(force=True)
+    total = len(model_names)
+    resident = set().union(*(e.resident for e in pool.endpoints if e.healthy))
+    for done, model_name in enumerate(model_names):
+        if model_name in resident:
+            continue
+        if progress_callback:
+            progress_callback((f"Loading {model_name}...", done, total))
+        start = time.time()
+        try:
+            pool.call(
+                model_name,
+                lambda client: client.generate(
+                    model=model_name, prompt="", keep_alive=get_keep_alive()
+                ),
+            )
+            logging.info(f"Preloaded {model_name} in {time.time() - start:.2f}s")
+        except Exception as e:
+            logging.warning(f"Could not preload {model_name}: {e}")
+    if progress_callback:
+        progress_callback(("Models ready.", total, total))
+
+
+async def apreload_models(model_names: list):
+    """Loads `model_names` on the running loop, taking a scheduler slot for each."""
+    scheduler = get_scheduler()
+    resident = await scheduler.refresh_resident()
+    for model_name in model_names:
+        if model_name in resident:
+            continue
+        try:
+            async with scheduler.slot(model_name):
+                response = await get_pool().acall(
+                    model_name,
+                    lambda client: client.generate(
+                        model=model_name, prompt="", keep_alive=scheduler.keep_alive
+                    ),
+                )
+            scheduler.record(model_name, (response.get("load_duration") or 0) / 1e9)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.warning(f"Could not preload {model_name}: {e}")
@@ -0,0 +1,321 @@
+import os
+import re
+import sqlite3
+import logging
+import threading
+import datetime as dt
+from config.config import read_research_config
+
+# Words too common to say anything about what an earlier session covered.
+STOPWORDS = {
+    "about",
+    "also",
+    "and",
+    "are",
+    "best",
+    "can",
+    "does",
+    "for",
+    "from",
+    "have",
+    "how",
+    "into",
+    "its",
+    "me",
+    "more",
+    "most",
+    "that",
+    "the",
+    "their",
+    "there",
+    "these",
+    "this",
+    "what",
+    "when",
+    "where",
+    "which",
+    "who",
+    "why",
+    "will",
+    "with",
+}
+MAX_QUERY_TERMS = 12
+
+
+def fts_query(text: str) -> str:
+    """Turns free text into an FTS5 query that matches any of its distinctive words."""
+    terms = []
+    for word in re.findall(r"\w+", text.lower()):
+        if len(word) > 2 and word not in STOPWORDS and word not in terms:
+            terms.append(word)
+    return " OR ".join(f'"{term}"' for term in terms[:MAX_QUERY_TERMS])
+
+
+class ResearchStore:
+    """
+    SQLite store of past research sessions with full-text search.
+
+    Sessions, their iterations (topic, analysis, critique, synthesis) and the
+    cleaned sources behind them are kept in plain tables; FTS5 indexes over the
+    iterations and sources are kept in sync by triggers and ranked with bm25, so
+    lookups stay index-bound as the store grows. Sources are stored once per url
+    and linked to every iteration that used them.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                id INTEGER PRIMARY KEY,
+                topic TEXT NOT NULL,
+                mode TEXT,
+                started TEXT NOT NULL,
+                finished TEXT,
+                checkpoint TEXT UNIQUE,
+                report TEXT
+            );
+            CREATE TABLE IF NOT EXISTS iterations (
+                id INTEGER PRIMARY KEY,
+                session_id INTEGER NOT NULL REFERENCES sessions (id),
+                label TEXT NOT NULL,
+                topic TEXT NOT NULL,
+                web_query TEXT,
+                analysis TEXT,
+                criticism TEXT,
+                synthesis TEXT,
+                next_question TEXT,
+                created TEXT NOT NULL,
+                UNIQUE (session_id, label)
+            );
+            CREATE TABLE IF NOT EXISTS sources (
+                id INTEGER PRIMARY KEY,
+                url TEXT NOT NULL UNIQUE,
+                text TEXT NOT NULL,
+                fetched TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS iteration_sources (
+                iteration_id INTEGER NOT NULL,
+                source_id INTEGER NOT NULL,
+                PRIMARY KEY (iteration_id, source_id)
+            ) WITHOUT ROWID;
+
+            CREATE VIRTUAL TABLE IF NOT EXISTS iterations_fts USING fts5 (
+                topic, analysis, criticism, synthesis,
+                content='iterations', content_rowid='id'
+            );
+            CREATE TRIGGER IF NOT EXISTS iterations_ai AFTER INSERT ON iterations BEGIN
+                INSERT INTO iterations_fts (rowid, topic, analysis, criticism, synthesis)
+                VALUES (new.id, new.topic, new.analysis, new.criticism, new.synthesis);
+            END;
+            CREATE TRIGGER IF NOT EXISTS iterations_ad AFTER DELETE ON iterations BEGIN
+                INSERT INTO iterations_fts (iterations_fts, rowid, topic, analysis, criticism, synthesis)
+                VALUES ('delete', old.id, old.topic, old.analysis, old.criticism, old.synthesis);
+            END;
+            CREATE TRIGGER IF NOT EXISTS iterations_au AFTER UPDATE ON iterations BEGIN
+                INSERT INTO iterations_fts (iterations_fts, rowid, topic, analysis, criticism, synthesis)
+                VALUES ('delete', old.id, old.topic, old.analysis, old.criticism, old.synthesis);
+                INSERT INTO iterations_fts (rowid, topic, analysis, criticism, synthesis)
+                VALUES (new.id, new.topic, new.analysis, new.criticism, new.synthesis);
+            END;
+
+            CREATE VIRTUAL TABLE IF NOT EXISTS sources_fts USING fts5 (
+                text, content='sources', content_rowid='id'
+            );
+            CREATE TRIGGER IF NOT EXISTS sources_ai AFTER INSERT ON sources BEGIN
+                INSERT INTO sources_fts (rowid, text) VALUES (new.id, new.text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS sources_ad AFTER DELETE ON sources BEGIN
+                INSERT INTO sources_fts (sources_fts, rowid, text)
+                VALUES ('delete', old.id, old.text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS sources_au AFTER UPDATE ON sources BEGIN
+                INSERT INTO sources_fts (sources_fts, rowid, text)
+                VALUES ('delete', old.id, old.text);
+                INSERT INTO sources_fts (rowid, text) VALUES (new.id, new.text);
+            END;
+            """
+        )
+        self._conn.commit()
+
+    def start_session(self, topic: str, mode: str, checkpoint: str = None) -> int:
+        """Adds a session and returns its id; a resumed checkpoint keeps its session."""
+        with self._lock:
+            if checkpoint:
+                row = self._conn.execute(
+                    "SELECT id FROM sessions WHERE checkpoint = ?", (checkpoint,)
+                ).fetchone()
+                if row:
+                    return row[0]
+            cursor = self._conn.execute(
+                "INSERT INTO sessions (topic, mode, started, checkpoint) VALUES (?, ?, ?, ?)",
+                (topic, mode, dt.datetime.now().isoformat(), checkpoint),
+            )
+            self._conn.commit()
+            return cursor.lastrowid
+
+    def finish_session(self, session_id: int, report: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE sessions SET finished = ?, report = ? WHERE id = ?",
+                (dt.datetime.now().isoformat(), report, session_id),
+            )
+            self._conn.commit()
+
+    def add_sources(self, sources: list):
+        """Stores cleaned {"url", "text"} sources; a url seen before gets the newer text."""
+        now = dt.datetime.now().isoformat()
+        with self._lock:
+            self._conn.executemany(
+                """INSERT INTO sources (url, text, fetched) VALUES (?, ?, ?)
+                ON CONFLICT (url) DO UPDATE SET text = excluded.text, fetched = excluded.fetched
+                WHERE text != excluded.text""",
+                [(s["url"], s["text"], now) for s in sources],
+            )
+            self._conn.commit()
+
+    def add_iteration(self, session_id: int, label: str, record: dict) -> int:
+        """Stores a research record and links it to its stored sources."""
+        values = (
+            record["topic"],
+            record.get("web_query"),
+            record.get("analysis"),
+            record.get("criticism"),
+            record.get("synthesis"),
+            record.get("next_question"),
+            dt.datetime.now().isoformat(),
+        )
+        with self._lock:
+            self._conn.execute(
+                """INSERT INTO iterations (session_id, label, topic, web_query, analysis,
+                    criticism, synthesis, next_question, created)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (session_id, label) DO UPDATE SET
+                    topic = excluded.topic, web_query = excluded.web_query,
+                    analysis = excluded.analysis, criticism = excluded.criticism,
+                    synthesis = excluded.synthesis, next_question = excluded.next_question""",
+                (session_id, label, *values),
+            )
+            iteration_id = self._conn.execute(
+                "SELECT id FROM iterations WHERE session_id = ? AND label = ?",
+                (session_id, label),
+            ).fetchone()[0]
+            urls = record.get("sources", [])
+            if urls:
+                self._conn.execute(
+                    f"""INSERT OR IGNORE INTO iteration_sources (iteration_id, source_id)
+                    SELECT ?, id FROM sources WHERE url IN ({", ".join("?" * len(urls))})""",
+                    (iteration_id, *urls),
+                )
+            self._conn.commit()
+            return iteration_id
+
+    def search_findings(
+        self, text: str, limit: int = 3, exclude_session: int = None
+    ) -> list:
+        """Returns the earlier iterations that best match `text`, best first."""
+        query = fts_query(text)
+        if not query:
+            return []
+        # Rank inside the full-text index first and join only the top rows.
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT i.session_id, s.topic, s.started, i.label, i.topic, i.synthesis,
+                    m.score
+                FROM (
+                    SELECT rowid AS id, bm25(iterations_fts, 2.0, 1.0, 0.5, 1.5) AS score
+                    FROM iterations_fts
+                    WHERE iterations_fts MATCH ? AND rowid NOT IN (
+                        SELECT id FROM iterations WHERE session_id IS ?
+                    )
+                    ORDER BY score LIMIT ?
+                ) m
+                JOIN iterations i ON i.id = m.id
+                JOIN sessions s ON s.id = i.session_id
+                ORDER BY m.score""",
+                (query, exclude_session, limit),
+            ).fetchall()
+        return [
+            {
+                "session_id": session_id,
+                "session_topic": session_topic,
+                "started": started,
+                "label": label,
+                "topic": topic,
+                "synthesis": synthesis,
+                "score": -score,
+            }
+            for session_id, session_topic, started, label, topic, synthesis, score in rows
+        ]
+
+    def search_sources(
+        self, text: str, limit: int = 3, exclude_session: int = None
+    ) -> list:
+        """
+        Returns the stored sources that best match `text`, best first.
+
+        Sources used by an iteration of `exclude_session` are left out.
+        """
+        query = fts_query(text)
+        if not query:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT s.url, s.text, s.fetched, m.score
+                FROM (
+                    SELECT rowid AS id, bm25(sources_fts) AS score
+                    FROM sources_fts
+                    WHERE sources_fts MATCH ? AND rowid NOT IN (
+                        SELECT l.source_id FROM iteration_sources l
+                        JOIN iterations i ON i.id = l.iteration_id
+                        WHERE i.session_id IS ?
+                    )
+                    ORDER BY score LIMIT ?
+                ) m
+                JOIN sources s ON s.id = m.id
+                ORDER BY m.score""",
+                (query, exclude_session, limit),
+            ).fetchall()
+        return [
+            {"url": url, "text": text, "fetched": fetched, "score": -score}
+            for url, text, fetched, score in rows
+        ]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                table: self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ("sessions", "iterations", "sources")
+            }
+
+
+_research_store = None
+_research_store_failed = False
+_research_store_lock = threading.Lock()
+
+
+def get_research_store() -> ResearchStore:
+    """
+    Returns the shared research store, or None when it is disabled in research_config.json.
+
+    A store that cannot be opened is logged once and stays disabled for the rest
+    of the process. Opening it touches the disk, so call this off the event loop.
+    """
+    global _research_store, _research_store_failed
+    with _research_store_lock:
+        if _research_store is None and not _research_store_failed:
+            research_config = read_research_config()
+            if not research_config.get("store", {}).get("enabled", True):
+                return None
+            path = os.path.join(research_config["research_output"], "research.sqlite")
+            try:
+                _research_store = ResearchStore(path)
+            except (sqlite3.Error, OSError) as e:
+                logging.warning(
+                    f"Research store {path} disabled, it could not be opened: {e}"
+                )
+                _research_store_failed = True
+        return _research_store
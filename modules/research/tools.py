@@ -1,43 +1,368 @@
 import re
+import time
+import asyncio
+import logging
+import threading
+import weakref
+import zlib
+import hashlib
+import numpy as np
+import httpx
 import requests
-from bs4 import BeautifulSoup
-from googlesearch import search
+import googlesearch
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+from bs4 import BeautifulSoup, SoupStrainer
+from config.config import read_research_config
+from modules.research.cache import get_page_cache, get_search_cache
 import datetime as dt
 import subprocess
+import functools
 import json
+from typing import Tuple
 
-import random
-import string
+# Optional faster HTML parsers: selectolax, then lxml, then the stdlib parser.
+try:
+    from selectolax.parser import HTMLParser
+except ImportError:
+    HTMLParser = None
+try:
+    import lxml  # noqa: F401
 
+    BS4_PARSER = "lxml"
+except ImportError:
+    BS4_PARSER = "html.parser"
 
-def search_google(query: str, num_results: int = 5):
+TEXT_CONTENT_TYPES = ("text/html", "application/xhtml+xml", "text/plain")
+
+
+def search_google(query: str, num_results: int = 5, use_cache: bool = True):
+    cache = get_search_cache() if use_cache else None
+    if cache:
+        urls = cache.get(query, num_results)
+        if urls is not None:
+            return urls
     try:
-        urls = list(search(query, num_results=num_results))
+        urls = list(googlesearch.search(query, num_results=num_results))
     except requests.exceptions.HTTPError:
         urls = []
+    if cache and urls:
+        cache.put(query, num_results, urls)
     return urls
 
 
-def fetch_page_content(url: str) -> str:
-    headers = generate_random_header()
-    # headers = {
-    #     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3",
-    #     "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-    #     "Accept-Language": "en-US,en;q=0.5",
-    #     "Accept-Encoding": "gzip, deflate, br",
-    #     "Connection": "keep-alive",
-    #     "Upgrade-Insecure-Requests": "1",
-    # }
+async def search_google_async(query: str, num_results: int = 5, use_cache: bool = True):
+    """
+    Async variant of search_google.
+
+    The cache and googlesearch-python both block on I/O, so cache lookups and
+    the live search run in the default executor.
+    """
+    cache = get_search_cache() if use_cache else None
+    if cache:
+        urls = await asyncio.to_thread(cache.get, query, num_results)
+        if urls is not None:
+            return urls
+    # The cache was already checked above; this thread only runs the live search.
+    urls = await asyncio.to_thread(search_google, query, num_results, False)
+    if cache and urls:
+        await asyncio.to_thread(cache.put, query, num_results, urls)
+    return urls
+
+
+def fetch_page_content(url: str, use_cache: bool = True) -> str:
+    cache = get_page_cache() if use_cache else None
+    cached = cache.lookup(url) if cache else None
+    if cached and cached["fresh"]:
+        return cached["text"]
+
+    headers = _request_headers(url, cached)
+    start = time.time()
     try:
-        resp = requests.get(url, headers=headers, timeout=10)
+        resp = get_http_session().get(url, headers=headers, timeout=10, stream=True)
     except requests.exceptions.ReadTimeout:
         return ""
     except requests.exceptions.MissingSchema:
         return ""
-    soup = BeautifulSoup(resp.text, "html.parser")
+    with resp:
+        if cached and resp.status_code == 304:
+            cache.mark_revalidated(
+                url, cached["fetch_seconds"] - (time.time() - start)
+            )
+            return cached["text"]
+        if cache:
+            cache.record_miss()
+        content_type = resp.headers.get("Content-Type", "text/html").lower()
+        if not content_type.startswith(TEXT_CONTENT_TYPES):
+            logging.info(f"Skipping {url}: unsupported content type '{content_type}'")
+            return ""
+        html = read_capped_body(resp, _get_fetch_config().get("max_bytes", 2_000_000))
+
+    text = page_text(html, content_type)
+    if cache and resp.ok:
+        _store_page(cache, url, html, text, resp.headers, time.time() - start)
+    return text
+
+
+async def fetch_page_content_async(url: str, use_cache: bool = True) -> str:
+    """
+    Async variant of fetch_page_content built on the shared httpx.AsyncClient.
+
+    The page cache reads and writes SQLite and gzip files, so it is used from
+    the default executor rather than the event loop.
+    """
+    cache = get_page_cache() if use_cache else None
+    cached = await asyncio.to_thread(cache.lookup, url) if cache else None
+    if cached and cached["fresh"]:
+        return cached["text"]
+
+    headers = _request_headers(url, cached)
+    max_bytes = _get_fetch_config().get("max_bytes", 2_000_000)
+    start = time.time()
+    try:
+        async with get_async_http_client().stream("GET", url, headers=headers) as resp:
+            if cached and resp.status_code == 304:
+                await asyncio.to_thread(
+                    cache.mark_revalidated,
+                    url,
+                    cached["fetch_seconds"] - (time.time() - start),
+                )
+                return cached["text"]
+            if cache:
+                cache.record_miss()
+            content_type = resp.headers.get("Content-Type", "text/html").lower()
+            if not content_type.startswith(TEXT_CONTENT_TYPES):
+                logging.info(
+                    f"Skipping {url}: unsupported content type '{content_type}'"
+                )
+                return ""
+            chunks = []
+            size = 0
+            async for chunk in resp.aiter_bytes(chunk_size=64 * 1024):
+                chunks.append(chunk)
+                size += len(chunk)
+                if size >= max_bytes:
+                    logging.info(f"Truncated {url} at {max_bytes} bytes")
+                    break
+    except (httpx.TimeoutException, httpx.UnsupportedProtocol):
+        return ""
+
+    html = decode_body(b"".join(chunks)[:max_bytes], content_type)
+    # Parsing is CPU-bound; keep it off the event loop.
+    text = await asyncio.to_thread(page_text, html, content_type)
+    if cache and resp.is_success:
+        await asyncio.to_thread(
+            _store_page, cache, url, html, text, resp.headers, time.time() - start
+        )
+    return text
+
+
+def _request_headers(url: str, cached: dict = None) -> dict:
+    headers = generate_header(url)
+    if cached:
+        # Stale entry: ask the server whether our copy is still current.
+        if cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+    return headers
+
+
+def _store_page(cache, url: str, html: str, text: str, headers, fetch_seconds: float):
+    cache.store(
+        url,
+        html,
+        text,
+        etag=headers.get("ETag"),
+        last_modified=headers.get("Last-Modified"),
+        fetch_seconds=fetch_seconds,
+    )
+
+
+def read_capped_body(resp: requests.Response, max_bytes: int) -> str:
+    """Reads a streamed response body, stopping after `max_bytes` bytes."""
+    chunks = []
+    size = 0
+    for chunk in resp.iter_content(chunk_size=64 * 1024):
+        chunks.append(chunk)
+        size += len(chunk)
+        if size >= max_bytes:
+            logging.info(f"Truncated {resp.url} at {max_bytes} bytes")
+            break
+    return decode_body(
+        b"".join(chunks)[:max_bytes], resp.headers.get("Content-Type", "")
+    )
+
+
+def decode_body(body: bytes, content_type: str) -> str:
+    """
+    Decodes a page body.
+
+    The charset comes from the Content-Type header, then from a <meta> tag in
+    the first bytes, and defaults to utf-8.
+    """
+    encoding = None
+    match = re.search(r"charset=([\w-]+)", content_type)
+    if not match:
+        match = re.search(rb"<meta[^>]+charset=[\"']?([\w-]+)", body[:4096], re.I)
+    if match:
+        encoding = match.group(1)
+        if isinstance(encoding, bytes):
+            encoding = encoding.decode("ascii")
+    try:
+        return body.decode(encoding or "utf-8", errors="replace")
+    except LookupError:
+        return body.decode("utf-8", errors="replace")
+
+
+def page_text(html: str, content_type: str) -> str:
+    if content_type.startswith("text/plain"):
+        return html
+    return extract_text(html)
+
+
+def extract_text(html: str) -> str:
+    """Returns the text of every <p> element, one paragraph per line."""
+    if HTMLParser is not None:
+        tree = HTMLParser(html)
+        return "\n".join(node.text() for node in tree.css("p"))
+    soup = BeautifulSoup(html, BS4_PARSER, parse_only=SoupStrainer("p"))
     return "\n".join(p.get_text() for p in soup.find_all("p"))
 
 
+@functools.lru_cache(maxsize=1)
+def _get_fetch_config() -> dict:
+    return read_research_config().get("fetch", {})
+
+
+_host_locks = {}
+_host_locks_guard = threading.Lock()
+_fetch_limits = {}
+
+
+def _get_fetch_limit(max_workers: int) -> threading.BoundedSemaphore:
+    """Returns the process-wide semaphore limiting concurrent page fetches."""
+    with _host_locks_guard:
+        if max_workers not in _fetch_limits:
+            _fetch_limits[max_workers] = threading.BoundedSemaphore(max_workers)
+        return _fetch_limits[max_workers]
+
+
+def _get_host_semaphore(url: str, per_host_limit: int) -> threading.BoundedSemaphore:
+    """Returns the shared semaphore limiting concurrent requests to the url's host."""
+    host = urlparse(url).netloc.lower()
+    with _host_locks_guard:
+        key = (host, per_host_limit)
+        if key not in _host_locks:
+            _host_locks[key] = threading.BoundedSemaphore(per_host_limit)
+        return _host_locks[key]
+
+
+def _timed_fetch(
+    url: str, per_host_limit: int, limit: threading.BoundedSemaphore
+) -> dict:
+    start = time.time()
+    try:
+        with limit, _get_host_semaphore(url, per_host_limit):
+            start = time.time()
+            content = fetch_page_content(url)
+    except (requests.exceptions.RequestException, ValueError) as e:
+        # ValueError: urlparse rejects a malformed url, e.g. a broken IPv6 host.
+        logging.warning(f"Failed to fetch {url}: {e}")
+        content = ""
+    return {"url": url, "content": content, "elapse": time.time() - start}
+
+
+def fetch_multiple_pages(
+    urls: list, max_workers: int = 8, per_host_limit: int = 2
+) -> list:
+    """
+    Fetches several pages concurrently on a thread pool.
+
+    `max_workers` bounds the fetches in flight across all concurrent calls.
+    Returns a list of {"url", "content", "elapse"} dicts in the same order as `urls`.
+    """
+    if not urls:
+        return []
+    max_workers = max(1, max_workers)
+    limit = _get_fetch_limit(max_workers)
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(urls))) as executor:
+        results = executor.map(lambda u: _timed_fetch(u, per_host_limit, limit), urls)
+        return list(results)
+
+
+_async_host_semaphores = weakref.WeakKeyDictionary()
+_async_fetch_limits = weakref.WeakKeyDictionary()
+
+
+async def _timed_fetch_async(
+    url: str, per_host_limit: int, limit: asyncio.Semaphore, timeout: float = None
+) -> dict:
+    # Per-host semaphores live per event loop, shared by every fetch on that loop.
+    host_semaphores = _async_host_semaphores.setdefault(asyncio.get_running_loop(), {})
+    start = time.time()
+    try:
+        key = (urlparse(url).netloc.lower(), per_host_limit)
+        if key not in host_semaphores:
+            host_semaphores[key] = asyncio.Semaphore(per_host_limit)
+        async with limit, host_semaphores[key]:
+            start = time.time()
+            content = await asyncio.wait_for(fetch_page_content_async(url), timeout)
+    except (httpx.HTTPError, httpx.InvalidURL, ValueError) as e:
+        # ValueError: urlparse rejects a malformed url, e.g. a broken IPv6 host.
+        logging.warning(f"Failed to fetch {url}: {e}")
+        content = ""
+    except asyncio.TimeoutError:
+        logging.warning(f"Gave up on {url} after {timeout}s")
+        content = ""
+    return {"url": url, "content": content, "elapse": time.time() - start}
+
+
+async def fetch_multiple_pages_async(
+    urls: list,
+    max_workers: int = 8,
+    per_host_limit: int = 2,
+    page_timeout: float = None,
+    deadline: float = None,
+) -> list:
+    """
+    Async variant of fetch_multiple_pages.
+
+    `max_workers` bounds the fetches in flight across every call on the running
+    event loop, e.g. concurrent tree branches and prefetches; the result order
+    matches `urls`. A page taking longer than `page_timeout` seconds comes back
+    empty, and so does every page still outstanding after `deadline` seconds.
+    Cancelling the call aborts all of its requests.
+    """
+    if not urls:
+        return []
+    # Like the per-host semaphores, the global limit is shared per event loop.
+    limits = _async_fetch_limits.setdefault(asyncio.get_running_loop(), {})
+    max_workers = max(1, max_workers)
+    if max_workers not in limits:
+        limits[max_workers] = asyncio.Semaphore(max_workers)
+    limit = limits[max_workers]
+    tasks = [
+        asyncio.create_task(_timed_fetch_async(u, per_host_limit, limit, page_timeout))
+        for u in urls
+    ]
+    try:
+        done, pending = await asyncio.wait(tasks, timeout=deadline)
+    finally:
+        for task in tasks:
+            task.cancel()
+    if pending:
+        logging.warning(
+            f"Fetch deadline of {deadline}s passed with {len(pending)} pages outstanding"
+        )
+    return [
+        task.result() if task in done else {"url": u, "content": "", "elapse": deadline}
+        for u, task in zip(urls, tasks)
+    ]
+
+
 def refine_prompt_for_web(prompt: str, agent):
     instructions = f"Based on the following prompt: '{prompt}', refine the users query for a google search. Return only the refined query. If relevant here is today's date: {dt.datetime.now().date()}. Do not put the query in quotes."
     return agent.model.get_response(instructions)
@@ -54,6 +379,83 @@ def clean_multiple_texts(texts: list) -> list:
     return [clean_text(text) for text in texts]
 
 
+MINHASH_PRIME = (1 << 31) - 1
+_minhash_rng = np.random.default_rng(42)
+MINHASH_A = _minhash_rng.integers(1, MINHASH_PRIME, size=64, dtype=np.int64)
+MINHASH_B = _minhash_rng.integers(0, MINHASH_PRIME, size=64, dtype=np.int64)
+
+
+def _minhash_signature(words: list, shingle_size: int) -> np.ndarray:
+    shingles = {
+        " ".join(words[i : i + shingle_size])
+        for i in range(max(1, len(words) - shingle_size + 1))
+    }
+    hashes = np.fromiter(
+        (zlib.crc32(sh.encode()) & MINHASH_PRIME for sh in shingles), dtype=np.int64
+    )
+    return (
+        (MINHASH_A[:, None] * hashes[None, :] + MINHASH_B[:, None]) % MINHASH_PRIME
+    ).min(axis=1)
+
+
+def remove_duplicate_paragraphs(
+    texts: list, threshold: float = 0.8, shingle_size: int = 5, bands: int = 16
+) -> Tuple[list, dict]:
+    """
+    Drops exact and near-duplicate paragraphs across several page texts.
+
+    Paragraphs are the lines produced by fetch_page_content, so this runs before
+    clean_multiple_texts joins them. Exact repeats are caught by hashing the
+    normalized words; near repeats by MinHash signatures over word shingles,
+    bucketed with LSH and kept out when their estimated Jaccard similarity to an
+    earlier paragraph reaches `threshold`. The first occurrence always wins.
+
+    Returns the de-duplicated texts and stats on what was removed.
+    """
+    rows = len(MINHASH_A) // bands
+    seen_exact = set()
+    buckets = {}
+    signatures = []
+    stats = {"paragraphs": 0, "removed": 0, "chars_saved": 0, "tokens_saved": 0}
+    results = []
+    for text in texts:
+        kept = []
+        for paragraph in text.split("\n"):
+            paragraph = clean_text(paragraph)
+            if not paragraph:
+                continue
+            stats["paragraphs"] += 1
+            words = re.findall(r"\w+", paragraph.lower())
+            exact_key = hashlib.sha1(" ".join(words).encode()).digest()
+            duplicate = exact_key in seen_exact
+            signature = None
+            band_keys = []
+            if not duplicate and len(words) >= shingle_size:
+                signature = _minhash_signature(words, shingle_size)
+                band_keys = [
+                    (b, signature[b * rows : (b + 1) * rows].tobytes())
+                    for b in range(bands)
+                ]
+                candidates = {i for key in band_keys for i in buckets.get(key, ())}
+                duplicate = any(
+                    np.mean(signatures[i] == signature) >= threshold for i in candidates
+                )
+            if duplicate:
+                stats["removed"] += 1
+                stats["chars_saved"] += len(paragraph)
+                continue
+            seen_exact.add(exact_key)
+            if signature is not None:
+                for key in band_keys:
+                    buckets.setdefault(key, []).append(len(signatures))
+                signatures.append(signature)
+            kept.append(paragraph)
+        results.append("\n".join(kept))
+    # Roughly four characters per token for English text.
+    stats["tokens_saved"] = stats["chars_saved"] // 4
+    return results, stats
+
+
 def recommend_web_sources(prompt: str, agent):
     instructions = f"""Based on this user's query: '{prompt}', provide a list of 5 web sources to search. An example response would be: '\nReddit\nWikipedia'. Return only the web sources, and nothing else. 
 """
@@ -99,58 +501,108 @@ def list_ollama_models():
         return []
 
 
-def generate_random_header():
+# Complete, self-consistent browser header profiles. A host always gets the same
+# profile so that it sees one browser reusing one keep-alive connection.
+HEADER_PROFILES = [
+    {
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
+        "Accept-Language": "en-US,en;q=0.9",
+        "Upgrade-Insecure-Requests": "1",
+    },
+    {
+        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.4 Safari/605.1.15",
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+        "Accept-Language": "en-US,en;q=0.9",
+        "Upgrade-Insecure-Requests": "1",
+    },
+    {
+        "User-Agent": "Mozilla/5.0 (X11; Linux x86_64; rv:125.0) Gecko/20100101 Firefox/125.0",
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+        "Accept-Language": "en-US,en;q=0.5",
+        "Upgrade-Insecure-Requests": "1",
+    },
+]
+
+
+def generate_header(url: str = "") -> dict:
     """
-    Generates a random HTTP header dictionary.
+    Returns browser-like request headers for `url`.
 
-    Returns:
-    dict: A dictionary representing a random HTTP header.
+    The profile is picked from the host name, so repeated requests to a site are
+    consistent. Accept-Encoding only lists encodings urllib3 can actually decode.
     """
+    host = urlparse(url).netloc.lower()
+    profile = HEADER_PROFILES[zlib.crc32(host.encode()) % len(HEADER_PROFILES)]
+    header = dict(profile)
+    header["Accept-Encoding"] = make_headers(accept_encoding=True)["accept-encoding"]
+    return header
 
-    # Lists of possible values for headers. Expand these for more variety.
-    user_agents = [
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3",
-        "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.1.2 Safari/605.1.15",
-        "Mozilla/5.0 (Linux; Android 10; K) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/80.0.3906.99 Mobile Safari/537.36",
-        "Mozilla/5.0 (iPhone; CPU iPhone OS 13_6_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/13.6.1 Mobile/17H38 Safari/605.1.15",
-    ]
 
-    accepts = [
-        "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-        "application/json",
-        "application/xml",
-        "image/gif, image/jpeg, image/png",
-    ]
+_http_session = None
+_http_session_lock = threading.Lock()
 
-    accept_languages = [
-        "en-US,en;q=0.5",
-        "es-ES,es;q=0.8",
-        "fr-FR,fr;q=0.7",
-        "de-DE,de;q=0.6",
-    ]
 
-    accept_encodings = [
-        "gzip, deflate, br",
-        "gzip",
-        "deflate",
-        "*",
-    ]
+def get_http_session() -> requests.Session:
+    """
+    Returns the process-wide HTTP session shared by the web tools.
 
-    connections = ["keep-alive", "close"]
+    The session keeps connections alive and pools them per host, bounded by the
+    "http" section of research_config.json. requests.Session is safe to share
+    between the fetch threads as long as its configuration is not changed.
+    """
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            http_config = read_research_config().get("http", {})
+            adapter = HTTPAdapter(
+                pool_connections=http_config.get("pool_connections", 32),
+                pool_maxsize=http_config.get("pool_maxsize_per_host", 4),
+                pool_block=True,
+            )
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update(generate_header())
+            _http_session = session
+        return _http_session
 
-    upgrade_insecure_requests = [
-        "1",
-        "0",
-    ]
 
-    # Randomly select values for each header
-    random_header = {
-        "User-Agent": random.choice(user_agents),
-        "Accept": random.choice(accepts),
-        "Accept-Language": random.choice(accept_languages),
-        "Accept-Encoding": random.choice(accept_encodings),
-        "Connection": random.choice(connections),
-        "Upgrade-Insecure-Requests": random.choice(upgrade_insecure_requests),
-    }
+def _pooled_get(*args, **kwargs):
+    return get_http_session().get(*args, **kwargs)
+
+
+# googlesearch-python calls requests.get directly; route it through the pool.
+googlesearch.get = _pooled_get
+
+
+_async_http_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """
+    Returns the pooled httpx.AsyncClient of the running event loop.
+
+    httpx clients are bound to the loop they were first used on, so every loop
+    gets its own, configured from the same "http" settings as get_http_session.
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _async_http_clients:
+        http_config = read_research_config().get("http", {})
+        _async_http_clients[loop] = httpx.AsyncClient(
+            timeout=10,
+            follow_redirects=True,
+            headers=generate_header(),
+            limits=httpx.Limits(
+                max_connections=http_config.get("pool_connections", 32),
+                max_keepalive_connections=http_config.get("pool_connections", 32),
+            ),
+        )
+    return _async_http_clients[loop]
+
 
-    return random_header
+async def close_async_http_client():
+    """Closes the running loop's httpx.AsyncClient, if it has one."""
+    client = _async_http_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
@@ -0,0 +1,181 @@
+import json
+import socket
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from modules.research.endpoints import EndpointPool, host_url
+
+MODEL = "stub-model"
+
+
+class StubOllama(BaseHTTPRequestHandler):
+    """Answers the few Ollama API routes the endpoint pool uses."""
+
+    def _json(self, obj: dict):
+        body = json.dumps(obj).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/version":
+            self._json({"version": "0.0.0"})
+        elif self.path == "/api/tags":
+            self._json({"models": [{"name": MODEL, "model": MODEL}]})
+        elif self.path == "/api/ps":
+            self._json({"models": []})
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append(self.path)
+        reply = {
+            "model": request["model"],
+            "created_at": "2024-01-01T00:00:00Z",
+            "message": {"role": "assistant", "content": f"port {self.server.port}"},
+            "done": True,
+        }
+        if not request.get("stream", True):
+            return self._json(reply)
+        body = (json.dumps(reply) + "\n").encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def up_host():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOllama)
+    server.port = server.server_address[1]
+    server.requests = []
+    threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+    ).start()
+    yield f"http://127.0.0.1:{server.port}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def down_host():
+    # A port that was free a moment ago refuses connections.
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}"
+
+
+def chat(client):
+    return client.chat(
+        model=MODEL, messages=[{"role": "user", "content": "hi"}], stream=False
+    )
+
+
+def test_host_url():
+    assert host_url("gpu-box") == "http://gpu-box:11434"
+    assert host_url("https://example.com/ollama/") == "https://example.com:443/ollama"
+
+
+def test_health_check(up_host, down_host):
+    pool = EndpointPool([down_host, up_host])
+    pool.check_health(force=True)
+    down, up = pool.endpoints
+    assert not down.healthy
+    assert up.healthy and up.models == {MODEL}
+    assert not pool.health_check_due()
+
+
+def test_call_fails_over(up_host, down_host):
+    pool = EndpointPool([down_host, up_host], health_check_seconds=3600)
+    for endpoint in pool.endpoints:
+        endpoint.checked_at = float("inf")
+    response = pool.call(MODEL, chat)
+    assert response["message"]["content"] == f"port {up_host.rsplit(':', 1)[1]}"
+    down, up = pool.endpoints
+    assert not down.healthy and down.failures == 1
+    assert MODEL in up.resident
+    assert [e.in_flight for e in pool.endpoints] == [0, 0]
+
+
+def test_acall_fails_over(up_host, down_host):
+    pool = EndpointPool([down_host, up_host], health_check_seconds=3600)
+    for endpoint in pool.endpoints:
+        endpoint.checked_at = float("inf")
+
+    async def main():
+        try:
+            return await pool.acall(MODEL, chat)
+        finally:
+            await pool.aclose()
+
+    response = asyncio.run(main())
+    assert response["message"]["content"].startswith("port")
+    assert pool.endpoints[0].failures == 1
+    assert [e.in_flight for e in pool.endpoints] == [0, 0]
+
+
+def test_stream_fails_over(up_host, down_host):
+    pool = EndpointPool([down_host, up_host], health_check_seconds=3600)
+    for endpoint in pool.endpoints:
+        endpoint.checked_at = float("inf")
+    chunks = list(
+        pool.stream(
+            MODEL,
+            lambda client: client.chat(
+                model=MODEL, messages=[{"role": "user", "content": "hi"}], stream=True
+            ),
+        )
+    )
+    assert len(chunks) == 1
+    assert pool.endpoints[0].failures == 1
+    assert [e.in_flight for e in pool.endpoints] == [0, 0]
+
+
+def test_in_flight_released_when_every_endpoint_fails(down_host):
+    pool = EndpointPool([down_host, down_host], health_check_seconds=3600)
+    for endpoint in pool.endpoints:
+        endpoint.checked_at = float("inf")
+    with pytest.raises(ConnectionError):
+        pool.call(MODEL, chat)
+    assert all(e.failures == 1 for e in pool.endpoints)
+    assert [e.in_flight for e in pool.endpoints] == [0, 0]
+
+
+def test_in_flight_released_when_the_call_raises(up_host):
+    pool = EndpointPool([up_host], health_check_seconds=3600)
+    pool.endpoints[0].checked_at = float("inf")
+
+    def broken(client):
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        pool.call(MODEL, broken)
+    assert pool.endpoints[0].in_flight == 0
+    assert pool.endpoints[0].healthy
+
+
+def test_least_loaded(up_host):
+    pool = EndpointPool([up_host, up_host, up_host], routing="least_loaded")
+    first = pool.acquire(MODEL)
+    second = pool.acquire(MODEL)
+    assert first is not second
+    pool.release(first)
+    # A tie on load goes to the endpoint that has the model resident.
+    second.resident.add(MODEL)
+    pool.release(second)
+    assert pool.acquire(MODEL) is second
+
+
+def test_unhealthy_endpoints_are_skipped(up_host, down_host):
+    pool = EndpointPool([down_host, up_host])
+    pool.check_health(force=True)
+    assert pool.acquire(MODEL) is pool.endpoints[1]